@@ -0,0 +1,207 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from json import dumps
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from ovmapper.epjson import object_names_from_json
+from ovmapper.input_file import SingleFile
+from ovmapper.output_variable import OutputVarClassification, OutputVarLine
+from ovmapper.processor import OutputVariableMapper
+from ovmapper.synthetic import SyntheticBuildTree
+
+# epjson_loads is not part of the pipeline, it times reading the same epJSON files whole with json, for comparison
+STAGES = ['discovery', 'csv_load', 'epjson_parse', 'epjson_loads', 'matching', 'merge', 'down_select', 'invert', 'dump']
+MATCHING_COLUMNS = ['num_instances', 'num_vars', 'nested_loop', 'index']
+
+
+def nested_loop_match(f: SingleFile, all_output_vars_this_file: List[OutputVarLine],
+                      objects_and_instance_names: Dict[str, List[str]]) -> List[OutputVarClassification]:
+    """
+    This function is the matching loop used before the instance name index, kept as the baseline for compare_matching:
+    every output variable key is compared against every instance name of every object type.
+    :param f: The SingleFile instance, for its gotcha rules
+    :param all_output_vars_this_file: The unique output variables from the output_vars.csv file
+    :param objects_and_instance_names: A dict of {object type => [instance names]} from the epJSON file
+    :return: A list of output variable classes, which contain the full set of likely input objects for each var.
+    """
+    classifications = []
+    for output_var in all_output_vars_this_file:
+        o = OutputVarClassification(output_var.var_name.upper())
+        if f._handle_special_var_cases(output_var, o.possible_input_objects):
+            continue
+        if not f._handle_gotchas_because_of_instance_names(output_var.var_name, o.possible_input_objects):
+            for obj_type, instance_names in objects_and_instance_names.items():
+                if obj_type.upper().startswith('COMPONENTCOST') or obj_type.upper().startswith('ENERGYMANAGEMENT'):
+                    continue
+                for instance_name in instance_names:
+                    if instance_name.upper() == output_var.key.upper():
+                        o.possible_input_objects.add(obj_type.upper())
+        classifications.append(o)
+    return classifications
+
+
+class MappingBenchmark:
+    """
+    This class times each stage of the mapping pipeline separately on synthetic build trees of increasing size, so
+    that regressions in the hot paths show up without needing an EnergyPlus build.  The per-file stages (csv load,
+    epJSON parse, matching and merging into the aggregate) are summed over all files in the tree.  The epjson_loads
+    column times loading the same epJSON files whole with json, to compare against the epjson_parse stage; use a large
+    instances_per_type to time files that are over the size where the epJSON scanner takes over.
+    """
+
+    def __init__(self, scales: List[int], repeats: int = 1, **tree_options):
+        """
+        This constructor takes the benchmark configuration.
+        :param scales: List of test directory counts to generate and time
+        :param repeats: Number of times to time each scale, the fastest time of each stage is reported
+        :param tree_options: Extra keyword arguments for SyntheticBuildTree, such as csv_rows or instances_per_type
+        """
+        self.scales = scales
+        self.repeats = repeats
+        self.tree_options = tree_options
+
+    def run(self) -> List[Dict[str, float]]:
+        """
+        Generates a tree for each scale and times each stage on it.
+        :return: A list of results for each scale, with the number of dirs and the time in seconds of each stage
+        """
+        results = list()
+        for num_dirs in self.scales:
+            with TemporaryDirectory() as temp_dir:
+                build_dir = Path(temp_dir) / 'build'
+                SyntheticBuildTree(num_dirs=num_dirs, **self.tree_options).write(build_dir)
+                timings: Optional[Dict[str, float]] = None
+                for _ in range(self.repeats):
+                    this_run = self._time_stages(build_dir, Path(temp_dir))
+                    if timings is None:
+                        timings = this_run
+                    else:
+                        timings = {stage: min(timings[stage], this_run[stage]) for stage in STAGES}
+                result = {'num_dirs': num_dirs}
+                result.update(timings)
+                results.append(result)
+        return results
+
+    def compare_matching(self) -> List[Dict[str, float]]:
+        """
+        Generates a tree for each scale and times the matching stage alone, once with the nested loop baseline and once
+        with the instance name index, summed over all files.  The inputs are loaded up front, so only the matching is
+        timed, and the index time includes building the index.  Both must give the same classifications.
+        Use a large instances_per_type to see the difference, since the nested loop grows with the number of instances.
+        :return: A list of results for each scale, with the number of dirs, instances and variables, and the time in
+                 seconds of each matching method
+        """
+        results = list()
+        for num_dirs in self.scales:
+            with TemporaryDirectory() as temp_dir:
+                build_dir = Path(temp_dir) / 'build'
+                SyntheticBuildTree(num_dirs=num_dirs, **self.tree_options).write(build_dir)
+                with redirect_stdout(StringIO()):
+                    files = OutputVariableMapper(build_dir, process=False)._find_applicable_files()
+                inputs = [(f, f._load_output_vars(), f._load_input_objects()) for f in files]
+                result = {
+                    'num_dirs': num_dirs,
+                    'num_instances': sum(len(names) for _, _, objects in inputs for names in objects.values()),
+                    'num_vars': sum(len(output_vars) for _, output_vars, _ in inputs),
+                }
+                for method in MATCHING_COLUMNS[2:]:
+                    best: Optional[float] = None
+                    for _ in range(self.repeats):
+                        t = perf_counter()
+                        for f, output_vars, objects in inputs:
+                            if method == 'nested_loop':
+                                f.output_variable_data = nested_loop_match(f, output_vars, objects)
+                            else:
+                                f.output_variable_data = f._match_vars_to_objects(output_vars, objects)
+                        elapsed = perf_counter() - t
+                        best = elapsed if best is None else min(best, elapsed)
+                    result[method] = best
+                    classifications = [
+                        [(x.output_variable_name, sorted(x.possible_input_objects)) for x in f.output_variable_data]
+                        for f, _, _ in inputs
+                    ]
+                    if method == 'nested_loop':
+                        baseline = classifications
+                    elif classifications != baseline:
+                        raise ValueError("Matching methods disagree on the %i dir tree" % num_dirs)
+                results.append(result)
+        return results
+
+    @staticmethod
+    def _time_stages(build_dir: Path, output_dir: Path) -> Dict[str, float]:
+        """
+        Runs the whole mapping pipeline once on a build tree, timing each stage.
+        :param build_dir: The build directory holding a testfiles directory
+        :param output_dir: A directory to dump the results into
+        :return: A dict of {stage name => time in seconds}
+        """
+        timings = {stage: 0.0 for stage in STAGES}
+        with redirect_stdout(StringIO()):
+            mapper = OutputVariableMapper(build_dir, process=False)
+            t = perf_counter()
+            files = mapper._find_applicable_files()
+            timings['discovery'] = perf_counter() - t
+            for f in files:
+                t = perf_counter()
+                output_vars = f._load_output_vars()
+                timings['csv_load'] += perf_counter() - t
+                t = perf_counter()
+                input_objects = f._load_input_objects()
+                timings['epjson_parse'] += perf_counter() - t
+                t = perf_counter()
+                with open(str(f.converted_json_file), 'rb') as epjson_file:
+                    object_names_from_json(epjson_file.read())
+                timings['epjson_loads'] += perf_counter() - t
+                t = perf_counter()
+                f.output_variable_data = f._match_vars_to_objects(output_vars, input_objects)
+                timings['matching'] += perf_counter() - t
+                t = perf_counter()
+                mapper._merge_file_results(f)
+                timings['merge'] += perf_counter() - t
+            t = perf_counter()
+            mapper.final_mapping = mapper._down_select_object_types()
+            timings['down_select'] = perf_counter() - t
+            t = perf_counter()
+            mapper.inverted_map = mapper._invert_mapping()
+            timings['invert'] = perf_counter() - t
+            t = perf_counter()
+            mapper.dump_results(output_dir)
+            timings['dump'] = perf_counter() - t
+        return timings
+
+    @staticmethod
+    def report(results: List[Dict[str, float]], report_path: Optional[Path] = None) -> None:
+        """
+        Prints a table of the benchmark results, and optionally writes them to a JSON file.
+        :param results: The results returned from run()
+        :param report_path: Optional path of a JSON file to write the results to
+        :return: Nothing
+        """
+        print(''.join(['%10s' % 'num_dirs'] + ['%14s' % stage for stage in STAGES]))
+        for result in results:
+            print(''.join(['%10i' % result['num_dirs']] + ['%14.4f' % result[stage] for stage in STAGES]))
+        if report_path:
+            with open(str(report_path), 'w') as f:
+                f.write(dumps({'stages': STAGES, 'results': results}, indent=2))
+
+    @staticmethod
+    def report_matching(results: List[Dict[str, float]], report_path: Optional[Path] = None) -> None:
+        """
+        Prints a table of the compare_matching results, and optionally writes them to a JSON file.
+        :param results: The results returned from compare_matching()
+        :param report_path: Optional path of a JSON file to write the results to
+        :return: Nothing
+        """
+        print(''.join(['%10s' % 'num_dirs'] + ['%14s' % column for column in MATCHING_COLUMNS] + ['%10s' % 'speedup']))
+        for result in results:
+            print(''.join(
+                ['%10i' % result['num_dirs'], '%14i' % result['num_instances'], '%14i' % result['num_vars']] +
+                ['%14.4f' % result[column] for column in MATCHING_COLUMNS[2:]] +
+                ['%9.0fx' % (result['nested_loop'] / result['index']) if result['index'] else '%10s' % '-']
+            ))
+        if report_path:
+            with open(str(report_path), 'w') as f:
+                f.write(dumps({'columns': MATCHING_COLUMNS, 'results': results}, indent=2))
@@ -0,0 +1,195 @@
+from json import dumps, loads
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from ovmapper.input_file import SingleFile
+from ovmapper.output_variable import OutputVarClassification, intern_types
+
+
+class ResultCache:
+    """
+    This class is a persistent on-disk cache of the classification results for each output_vars.csv file.  Entries are
+    keyed on the output_vars.csv path, and are only reused if the size and modification time of both the csv file and
+    the epJSON file it resolved to are unchanged, so only test directories that were re-run get processed again.  The
+    whole cache is discarded if the rule table of known gotchas has changed since it was written.
+    The cache file holds a header line followed by one JSON record per test directory, so the cache never has to be
+    held in memory as a whole: only the fingerprint and file offset of each entry are kept, cached classifications are
+    read back one record at a time, and new results are written to the next cache file as soon as they are stored.
+    Call save() and then close() once the files have been processed, so that no file handles are left open.
+    """
+
+    # Bump this whenever the classification logic or the cache file layout changes so that stale results are not reused
+    version = 2
+
+    def __init__(self, cache_path: Path, rules_signature: str = ''):
+        """
+        This constructor takes the path to the cache file and indexes any existing entries in it.  If the file is
+        missing, unreadable, or from a different cache version or rule table, the cache just starts out empty.
+        :param cache_path: Path to the cache file, which does not need to exist yet
+        :param rules_signature: Signature of the rule table used to classify the files
+        """
+        self.cache_path = cache_path
+        self.temp_path = self.cache_path.with_name(self.cache_path.name + '.tmp')
+        self.rules_signature = rules_signature
+        # {output_vars.csv path => (input fingerprint, offset of the record in the existing cache file)}
+        self.entries: Dict[str, Tuple[list, int]] = dict()
+        self.hits = 0
+        self.misses = 0
+        self._old_file: Optional[BinaryIO] = None
+        self._new_file: Optional[BinaryIO] = None
+        # the same as entries, for the records written to the next cache file so far
+        self._new_entries: Dict[str, Tuple[list, int]] = dict()
+        if self.cache_path.exists():
+            try:
+                self._index_existing_file()
+            except Exception as e:
+                print("Could not read result cache at %s, starting fresh" % self.cache_path)
+                print("Reason: " + str(e))
+                self.entries = dict()
+
+    def _index_existing_file(self) -> None:
+        """
+        Reads through the existing cache file once, keeping the fingerprint and offset of each record, but not the
+        classifications.
+        :return: Nothing
+        """
+        with open(str(self.cache_path), 'rb') as f:
+            header = loads(f.readline())
+            if header.get('version') != self.version or header.get('rules') != self.rules_signature:
+                return
+            offset = f.tell()
+            for line in f:
+                record = loads(line)
+                self.entries[record['path']] = (record['fingerprint'], offset)
+                offset += len(line)
+
+    def _close_old_file(self) -> None:
+        """
+        Closes the existing cache file, if it is open.
+        :return: Nothing
+        """
+        if self._old_file is not None:
+            self._old_file.close()
+            self._old_file = None
+
+    def _read_record_line(self, path: str) -> bytes:
+        """
+        Reads the raw record line of an entry from the existing cache file, opening that file on the first read.
+        :param path: The output_vars.csv path of the entry
+        :return: The record line, including the line ending
+        """
+        if self._old_file is None:
+            self._old_file = open(str(self.cache_path), 'rb')
+        self._old_file.seek(self.entries[path][1])
+        return self._old_file.readline()
+
+    def _write_record_line(self, path: str, fingerprint: list, line: bytes) -> None:
+        """
+        Writes a record line to the next cache file, starting that file if this is the first record.
+        :param path: The output_vars.csv path of the entry
+        :param fingerprint: The input fingerprint of the entry
+        :param line: The record line, including the line ending
+        :return: Nothing
+        """
+        if self._new_file is None:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self._new_file = open(str(self.temp_path), 'wb')
+            self._new_file.write(dumps({'version': self.version, 'rules': self.rules_signature}).encode() + b'\n')
+        self._new_entries[path] = (fingerprint, self._new_file.tell())
+        self._new_file.write(line)
+
+    @staticmethod
+    def fingerprint(single_file: SingleFile) -> list:
+        """
+        Gathers the inputs that would change the classification results for a single file.
+        :param single_file: A SingleFile instance with resolved paths
+        :return: A JSON serializable list of the epJSON path and the size and modification time of both input files
+        """
+        csv_stat = single_file.original_output_var_file.stat()
+        json_stat = single_file.converted_json_file.stat()
+        return [
+            str(single_file.converted_json_file),
+            csv_stat.st_size, csv_stat.st_mtime_ns, json_stat.st_size, json_stat.st_mtime_ns
+        ]
+
+    def is_fresh(self, single_file: SingleFile) -> bool:
+        """
+        Checks whether the cache has results for a single file that are still valid, without loading them.  The input
+        fingerprint is kept on the file, so that store() saves the fingerprint of the inputs as they were before the
+        file was processed, and a change to the inputs while processing is caught on the next run.
+        :param single_file: A SingleFile instance with resolved paths
+        :return: True if the cached entry exists and the input fingerprint is unchanged
+        """
+        single_file.input_fingerprint = self.fingerprint(single_file)
+        entry = self.entries.get(str(single_file.original_output_var_file))
+        if entry is not None and entry[0] == single_file.input_fingerprint:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def lookup(self, single_file: SingleFile) -> List[OutputVarClassification]:
+        """
+        Loads the cached results for a single file, which should already have been checked with is_fresh().  The record
+        is carried over to the next cache file as it is.
+        :param single_file: A SingleFile instance with resolved paths
+        :return: The cached list of classifications
+        """
+        path = str(single_file.original_output_var_file)
+        line = self._read_record_line(path)
+        self._write_record_line(path, self.entries[path][0], line)
+        return [OutputVarClassification(name, intern_types(types)) for name, types in loads(line)['classifications']]
+
+    def store(self, single_file: SingleFile) -> None:
+        """
+        Writes the classification results of a processed file to the next cache file, under the input fingerprint taken
+        by is_fresh() before the file was processed.  Files that were never checked with is_fresh() are not stored,
+        since there is no way to tell anymore which version of the inputs they were processed from.
+        :param single_file: A processed SingleFile instance
+        :return: Nothing
+        """
+        if single_file.input_fingerprint is None:
+            return
+        path = str(single_file.original_output_var_file)
+        record = {
+            'path': path,
+            'fingerprint': single_file.input_fingerprint,
+            'classifications': [
+                [c.output_variable_name, sorted(c.possible_input_objects)] for c in single_file.output_variable_data
+            ],
+        }
+        self._write_record_line(path, single_file.input_fingerprint, dumps(record).encode() + b'\n')
+
+    def save(self) -> None:
+        """
+        Finishes the next cache file and moves it over the existing one, which later lookups then read from.  Entries of
+        the existing file that were not looked up or stored in this run, such as test directories outside of a
+        --test-dirs subset, are copied over too.  The new file is written under a temporary name, so an interrupted run
+        can't corrupt the cache.
+        :return: Nothing
+        """
+        for path, (fingerprint, _) in self.entries.items():
+            if path not in self._new_entries:
+                self._write_record_line(path, fingerprint, self._read_record_line(path))
+        # the existing file has to be closed before it can be replaced on Windows
+        self._close_old_file()
+        if self._new_file is None:
+            return
+        self._new_file.close()
+        self._new_file = None
+        self.temp_path.replace(self.cache_path)
+        self.entries = self._new_entries
+        self._new_entries = dict()
+
+    def close(self) -> None:
+        """
+        Closes the open cache files.  Records written since the last save() are thrown away, and the existing cache file
+        is left as it was.
+        :return: Nothing
+        """
+        self._close_old_file()
+        if self._new_file is not None:
+            self._new_file.close()
+            self._new_file = None
+            self._new_entries = dict()
+            self.temp_path.unlink()
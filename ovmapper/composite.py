@@ -0,0 +1,108 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class InstanceNameAutomaton:
+    """
+    This class is an Aho-Corasick automaton over the instance names of an input file, which finds every instance name
+    contained in a string in a single pass over it.  The time to search a string is linear in its length plus the
+    number of names found, no matter how many instance names there are, so it can be run on the key of every output
+    variable to resolve composite keys that are made by joining instance names together, such as
+    {case_name}InZone{zone_name} for refrigerated cases or {zone_name} {people_name} for zone list internal gains.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        """
+        This constructor builds the automaton: a trie of the names, then the failure links with a breadth first walk.
+        :param names: The names to search for, which should already be upper case if searches will be upper case
+        """
+        # one entry per state: the transitions, the failure link, and the names that end at this state
+        self._goto: List[Dict[str, int]] = [dict()]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [tuple()]
+        for name in names:
+            if not name:
+                continue
+            state = 0
+            for ch in name:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    self._out.append(tuple())
+                state = next_state
+            if name not in self._out[state]:
+                self._out[state] = (name,)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail_target if fail_target != next_state else 0
+                # states are visited in breadth first order, so the failure target's output is already complete
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Finds every occurrence of every name in a string, including overlapping ones.
+        :param text: The string to search
+        :return: A list of (start, end, name) tuples, where text[start:end] == name, in order of their end position
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found: List[Tuple[int, int, str]] = list()
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for name in out[state]:
+                found.append((i + 1 - len(name), i + 1, name))
+        return found
+
+    def tiling_names(self, text: str, joiners: Iterable[str]) -> Set[str]:
+        """
+        Finds the names that make up a string when the whole string is read as names joined together, such as a key made
+        of a case name, INZONE and a zone name.  Each gap between two names must be exactly one of the joiners.  Names
+        found anywhere else, such as a zone named ZONE 1 inside a key ZONE 18, are not part of a reading of the whole
+        string, so they are left out.
+        :param text: The string to read
+        :param joiners: The non-empty strings allowed between two names, empty strings are ignored
+        :return: The set of names used by any reading of the whole string, which is empty if there is none
+        """
+        length = len(text)
+        names_from: Dict[int, List[Tuple[int, str]]] = dict()
+        for start, end, name in self.find_all(text):
+            names_from.setdefault(start, []).append((end, name))
+        joiners_from: Dict[int, List[int]] = dict()
+        for joiner in joiners:
+            if not joiner:
+                continue
+            start = text.find(joiner)
+            while start != -1:
+                joiners_from.setdefault(start, []).append(start + len(joiner))
+                start = text.find(joiner, start + 1)
+        # forwards: the positions where a name can start after reading names and joiners from the start of the string
+        name_can_start = [False] * (length + 1)
+        name_can_start[0] = True
+        for i in range(length):
+            if name_can_start[i]:
+                for end, _ in names_from.get(i, []):
+                    for joiner_end in joiners_from.get(end, []):
+                        name_can_start[joiner_end] = True
+        # backwards: the positions where a name can end, with the rest of the string read as joiners and names
+        name_can_end = [False] * (length + 1)
+        name_can_end[length] = True
+        for i in range(length - 1, 0, -1):
+            name_can_end[i] = any(
+                name_can_end[end] for joiner_end in joiners_from.get(i, []) for end, _ in names_from.get(joiner_end, [])
+            )
+        return {
+            name for start, matches in names_from.items() if name_can_start[start]
+            for end, name in matches if name_can_end[end]
+        }
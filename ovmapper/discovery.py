@@ -0,0 +1,281 @@
+from os import scandir
+from pathlib import Path
+from queue import Queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from ovmapper.cache import ResultCache
+from ovmapper.input_file import SingleFile
+
+# Queue item marking the end of the discovery
+_DONE = object()
+
+# File EnergyPlus writes into the run directory once a simulation has finished, successfully or not
+RUN_FINISHED_MARKER = 'eplusout.end'
+
+
+class FileDiscovery:
+    """
+    This class finds the applicable files in the testfiles directory of a build.  The directories are walked in a
+    background thread that feeds a queue, so the caller can start processing the first files while the rest of the tree
+    is still being listed.  Each test directory is listed exactly once with os.scandir, and both the output_vars.csv
+    file and the epJSON file are resolved from that listing instead of with a stat call for each candidate name, which
+    adds up to thousands of round trips on network file systems.  If a result cache is given, checking whether each
+    file is fresh also happens in the background thread, since that needs a stat of both input files.
+    Files always come out in the sorted order of their directory names, no matter how long each listing takes.
+    """
+
+    def __init__(self, test_file_dir: Path, test_dirs: Optional[List[str]] = None,
+                 shard: Optional[Tuple[int, int]] = None, rules_file: Optional[Path] = None,
+                 cache: Optional[ResultCache] = None, composite_keys: bool = False):
+        """
+        This constructor takes the discovery options, the directory is not read until the instance is iterated.
+        :param test_file_dir: Path to the testfiles directory of the build
+        :param test_dirs: Optional list of test directory names to include, instead of every directory in testfiles
+        :param shard: Optional (index, count) pair to only include every count-th directory of the sorted directory list
+                      starting at index
+        :param rules_file: Optional path to a rules JSON file of known gotchas, passed along to each SingleFile
+        :param cache: Optional result cache to check each file against
+        :param composite_keys: If True, each SingleFile also matches composite keys
+        """
+        self.test_file_dir = test_file_dir
+        self.test_dirs = test_dirs
+        self.shard = shard
+        self.rules_file = rules_file
+        self.cache = cache
+        self.composite_keys = composite_keys
+        self.num_candidates = 0
+        self.num_skipped = 0
+        self.elapsed = 0.0
+        self._queue: Queue = Queue()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def num_files(self) -> int:
+        """
+        The number of applicable files, which is an upper bound while the discovery is still running, and exact once all
+        files have been iterated.
+        :return: The number of candidate directories that have not been skipped so far
+        """
+        return self.num_candidates - self.num_skipped
+
+    def __iter__(self) -> Iterator[Tuple[SingleFile, bool]]:
+        """
+        Starts the discovery thread and iterates over the files as they are found.
+        :return: An iterator over (unprocessed SingleFile instance, True if the result cache is fresh for it) pairs
+        """
+        # the thread is only started here so that a process pool created before iterating forks its workers
+        # before there is a second thread in this process
+        self._thread = Thread(target=self._walk, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Stops the discovery thread, if it is still running, and waits for it.
+        :return: Nothing
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _candidate_dirs(self) -> List[Path]:
+        """
+        Lists the testfiles directory and filters it down to the requested test dirs or shard, if any.
+        :return: The sorted list of candidate test directory paths
+        """
+        with scandir(str(self.test_file_dir)) as entries:
+            names = sorted(entry.name for entry in entries if entry.is_dir())
+        if self.test_dirs is not None:
+            requested_dirs = set(self.test_dirs)
+            names = [x for x in names if x in requested_dirs]
+        if self.shard is not None:
+            shard_index, shard_count = self.shard
+            names = names[shard_index::shard_count]
+        return [self.test_file_dir / x for x in names]
+
+    def _walk(self) -> None:
+        """
+        The discovery thread entry point, which lists each candidate directory and queues up the applicable files.  Any
+        error is queued up too, so it gets raised in the consuming thread.
+        :return: Nothing
+        """
+        t_start = perf_counter()
+        try:
+            candidate_dirs = self._candidate_dirs()
+            self.num_candidates = len(candidate_dirs)
+            for test_dir in candidate_dirs:
+                if self._stop.is_set():
+                    break
+                with scandir(str(test_dir)) as entries:
+                    dir_entries = {entry.name for entry in entries}
+                if 'output_vars.csv' not in dir_entries:
+                    self.num_skipped += 1
+                    continue
+                f = SingleFile(
+                    test_dir / 'output_vars.csv', process_now=False, rules_file=self.rules_file,
+                    dir_entries=dir_entries, composite_keys=self.composite_keys
+                )
+                if not f.keep:
+                    self.num_skipped += 1
+                    continue
+                self._queue.put((f, self.cache.is_fresh(f) if self.cache else False))
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self.elapsed = perf_counter() - t_start
+            self._queue.put(_DONE)
+
+
+class _DirState:
+    """
+    This class holds what a TestDirWatcher knows about a test directory that has not been processed yet.
+    """
+
+    __slots__ = ('dir_mtime', 'dir_entries', 'signature', 'stable_since')
+
+    def __init__(self, dir_mtime: int, dir_entries: Set[str]):
+        """
+        This constructor takes a fresh listing of the test directory.
+        :param dir_mtime: Modification time of the test directory when it was listed, in nanoseconds
+        :param dir_entries: Set of the file names in the test directory
+        """
+        self.dir_mtime = dir_mtime
+        self.dir_entries = dir_entries
+        self.signature: Optional[Tuple[int, int, int, int]] = None
+        self.stable_since = 0.0
+
+
+class TestDirWatcher:
+    """
+    This class polls the testfiles directory of a build while the integration tests are still running, and hands out
+    each test directory once, as soon as its output_vars.csv and epJSON files are complete.  A directory is taken to be
+    complete once EnergyPlus has written its eplusout.end file, and the size and modification time of both input files
+    have not changed for the settle time since.  Files that have only stopped changing are not enough, since a slow
+    simulation can go quiet for longer than the settle time and then append more rows, which would be lost because a
+    directory is never looked at again once it has been handed out.
+    Polling is kept cheap on large trees: each poll lists the testfiles directory once, then only stats the directories
+    that have not been handed out yet, and only lists one of those again if its modification time changed.  The two
+    input files are only stat'ed for directories that already have both of them.
+    """
+
+    # not a test class, despite the name
+    __test__ = False
+
+    def __init__(self, test_file_dir: Path, test_dirs: Optional[List[str]] = None, rules_file: Optional[Path] = None,
+                 cache: Optional[ResultCache] = None, settle_time: float = 5.0, composite_keys: bool = False):
+        """
+        This constructor takes the watch options, the directory is not read until the first poll.
+        :param test_file_dir: Path to the testfiles directory of the build, which does not need to exist yet
+        :param test_dirs: Optional list of test directory names to watch, instead of every directory in testfiles
+        :param rules_file: Optional path to a rules JSON file of known gotchas, passed along to each SingleFile
+        :param cache: Optional result cache to check each file against
+        :param settle_time: Number of seconds the input files must be unchanged after the simulation finished before a
+                            directory is handed out
+        :param composite_keys: If True, each SingleFile also matches composite keys
+        """
+        self.test_file_dir = test_file_dir
+        self.test_dirs = set(test_dirs) if test_dirs is not None else None
+        self.rules_file = rules_file
+        self.cache = cache
+        self.composite_keys = composite_keys
+        self.settle_time = settle_time
+        self.done_dirs: Set[str] = set()
+        self.num_files = 0
+        self.elapsed = 0.0
+        self.last_change = perf_counter()
+        self._states: Dict[str, _DirState] = dict()
+
+    def poll(self, final: bool = False) -> List[Tuple[SingleFile, bool]]:
+        """
+        Looks through the test directories once and returns the ones that became ready since the last poll.
+        :param final: If True, the tests are known to be finished, so every directory with an output_vars.csv file is
+                      handed out without waiting for the simulation to finish or the settle time
+        :return: A list of (unprocessed SingleFile instance, True if the result cache is fresh for it) pairs, sorted by
+                 directory name
+        """
+        t_start = perf_counter()
+        ready: List[Tuple[SingleFile, bool]] = list()
+        try:
+            with scandir(str(self.test_file_dir)) as entries:
+                test_dirs = [
+                    (entry.name, entry.stat().st_mtime_ns) for entry in entries
+                    if entry.name not in self.done_dirs and entry.is_dir() and
+                    (self.test_dirs is None or entry.name in self.test_dirs)
+                ]
+        except FileNotFoundError:
+            test_dirs = []
+        for name, dir_mtime in sorted(test_dirs):
+            f = self._check_dir(name, dir_mtime, t_start, final)
+            if f is None:
+                continue
+            self.done_dirs.add(name)
+            self._states.pop(name, None)
+            if f.keep:
+                self.num_files += 1
+                ready.append((f, self.cache.is_fresh(f) if self.cache else False))
+        self.elapsed += perf_counter() - t_start
+        return ready
+
+    def idle_time(self) -> float:
+        """
+        The time since anything last changed in the watched test directories.
+        :return: The idle time in seconds
+        """
+        return perf_counter() - self.last_change
+
+    def _check_dir(self, name: str, dir_mtime: int, now: float, final: bool) -> Optional[SingleFile]:
+        """
+        Updates the state of a single test directory that has not been handed out yet.
+        :param name: Name of the test directory
+        :param dir_mtime: Current modification time of the test directory, in nanoseconds
+        :param now: The time of this poll
+        :param final: If True, the directory is ready as soon as it has an output_vars.csv file
+        :return: An unprocessed SingleFile instance if the directory is ready, otherwise None
+        """
+        test_dir = self.test_file_dir / name
+        state = self._states.get(name)
+        if state is None or state.dir_mtime != dir_mtime:
+            with scandir(str(test_dir)) as entries:
+                state = _DirState(dir_mtime, {entry.name for entry in entries})
+            self._states[name] = state
+            self.last_change = now
+        if 'output_vars.csv' not in state.dir_entries:
+            return None
+        if not final:
+            if RUN_FINISHED_MARKER not in state.dir_entries:
+                return None
+            epjson_name = next(
+                (x for x in SingleFile.candidate_epjson_names(name) if x in state.dir_entries), None
+            )
+            if epjson_name is None:
+                return None
+            try:
+                csv_stat = (test_dir / 'output_vars.csv').stat()
+                json_stat = (test_dir / epjson_name).stat()
+            except FileNotFoundError:
+                return None
+            signature = (csv_stat.st_size, csv_stat.st_mtime_ns, json_stat.st_size, json_stat.st_mtime_ns)
+            if signature != state.signature:
+                state.signature = signature
+                state.stable_since = now
+                self.last_change = now
+                return None
+            if now - state.stable_since < self.settle_time:
+                return None
+        return SingleFile(
+            test_dir / 'output_vars.csv', process_now=False, rules_file=self.rules_file, dir_entries=state.dir_entries,
+            composite_keys=self.composite_keys
+        )
@@ -0,0 +1,217 @@
+from json import loads
+from mmap import mmap, ACCESS_READ
+from os import fstat
+from pathlib import Path
+from re import compile
+from typing import Dict, List
+
+# Gotcha: The newer VRF object does not have a name, it uses heat_pump_name
+OBJECTS_NAMED_BY_FIELD = {'AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl': 'heat_pump_name'}
+
+# Files up to this size are loaded whole with json, which is at least as fast as the scanner on them and only needs
+# about three times the file size in memory.  Larger files go through the scanner, which is faster there and keeps
+# memory flat.
+JSON_LOADS_MAX_BYTES = 4 << 20
+
+_WHITESPACE = compile(rb'[ \t\n\r]*')
+_STRING_PATTERN = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+_STRING = compile(_STRING_PATTERN)
+# consumes everything up to the next brace that is not inside a string
+_UP_TO_BRACE = compile(rb'[^"{}]*(?:' + _STRING_PATTERN + rb'[^"{}]*)*')
+# matches a whole object nested at most two deep, which covers nearly every instance body (extensible field lists hold
+# flat objects), so most instances are skipped in a single regex call rather than brace by brace
+_FLAT_OBJECT_PATTERN = rb'\{[^"{}]*(?:' + _STRING_PATTERN + rb'[^"{}]*)*\}'
+_SHALLOW_OBJECT_PATTERN = rb'\{[^"{}]*(?:(?:' + _STRING_PATTERN + rb'|' + _FLAT_OBJECT_PATTERN + rb')[^"{}]*)*\}'
+_SHALLOW_OBJECT = compile(_SHALLOW_OBJECT_PATTERN)
+# matches a whole instance member in one call: a name without escapes, the colon, a shallow body, and the comma or brace
+# after it, so the common case costs one regex call per instance instead of one per token
+_INSTANCE = compile(
+    rb'[ \t\n\r]*"([^"\\\x00-\x1f]*)"[ \t\n\r]*:[ \t\n\r]*(' + _SHALLOW_OBJECT_PATTERN + rb')[ \t\n\r]*([,}])'
+)
+_OPEN_BRACE = ord('{')
+_CLOSE_BRACE = ord('}')
+_COLON = ord(':')
+_COMMA = ord(',')
+
+
+class _Scanner:
+    """
+    This class walks the raw bytes of an epJSON file, only decoding the object type and instance name keys.  The field
+    bodies of each instance are skipped over by matching braces, so they are never materialized as Python objects.
+    """
+
+    def __init__(self, data):
+        """
+        This constructor takes the raw epJSON contents to scan.
+        :param data: A bytes-like object, such as a memory mapped file
+        """
+        self.data = data
+        self.pos = 0
+
+    def error(self, message: str) -> ValueError:
+        """
+        Builds an exception describing a problem at the current position.
+        :param message: Description of the problem
+        :return: A ValueError instance to be raised by the caller
+        """
+        return ValueError("Invalid epJSON at byte %i: %s" % (self.pos, message))
+
+    def skip_whitespace(self) -> int:
+        """
+        Moves past any whitespace and returns the next byte, or -1 at the end of the data.
+        :return: The integer value of the next non-whitespace byte
+        """
+        self.pos = _WHITESPACE.match(self.data, self.pos).end()
+        if self.pos >= len(self.data):
+            return -1
+        return self.data[self.pos]
+
+    def expect(self, byte_value: int, description: str) -> None:
+        """
+        Moves past whitespace and then a single expected structural byte.
+        :param byte_value: The integer value of the expected byte
+        :param description: Human readable description of the expected byte for error messages
+        :return: Nothing
+        """
+        if self.skip_whitespace() != byte_value:
+            raise self.error("expected " + description)
+        self.pos += 1
+
+    def read_string(self) -> str:
+        """
+        Reads a single JSON string at the current position, handling any escapes.
+        :return: The decoded string
+        """
+        self.skip_whitespace()
+        m = _STRING.match(self.data, self.pos)
+        if not m:
+            raise self.error("expected a string")
+        self.pos = m.end()
+        return loads(m.group())
+
+    def skip_object(self) -> int:
+        """
+        Skips over an entire JSON object without decoding it.
+        :return: The position where the object started, so callers can decode it if they do need the contents
+        """
+        self.skip_whitespace()
+        start = self.pos
+        if self.pos >= len(self.data) or self.data[self.pos] != _OPEN_BRACE:
+            raise self.error("expected an object")
+        m = _SHALLOW_OBJECT.match(self.data, self.pos)
+        if m:
+            self.pos = m.end()
+            return start
+        depth = 0
+        while True:
+            if self.pos >= len(self.data):
+                raise self.error("unterminated object")
+            if self.data[self.pos] == _OPEN_BRACE:
+                depth += 1
+            else:
+                depth -= 1
+            self.pos += 1
+            if depth == 0:
+                return start
+            self.pos = _UP_TO_BRACE.match(self.data, self.pos).end()
+
+    def next_member(self) -> bool:
+        """
+        Moves to the next member of the current object, consuming the separating comma or the closing brace.
+        :return: True if another member follows, False if the object was closed
+        """
+        c = self.skip_whitespace()
+        if c == _COMMA:
+            self.pos += 1
+            return True
+        if c == _CLOSE_BRACE:
+            self.pos += 1
+            return False
+        raise self.error("expected ',' or '}'")
+
+    def first_member(self) -> bool:
+        """
+        Opens an object and checks whether it has any members.
+        :return: True if the object has a first member, False if it was empty and has been closed
+        """
+        self.expect(_OPEN_BRACE, "'{'")
+        if self.skip_whitespace() == _CLOSE_BRACE:
+            self.pos += 1
+            return False
+        return True
+
+
+def object_names_from_bytes(data) -> Dict[str, List[str]]:
+    """
+    This function extracts the object types and instance names from raw epJSON contents.  The result is identical to
+    loading the whole file with json and collecting the instance keys of each object type, including the handling of
+    duplicate keys, but none of the instance field data is ever decoded.
+    :param data: A bytes-like object holding the epJSON contents
+    :return: A dict of {object type => [instance names]}, in file order
+    """
+    scanner = _Scanner(data)
+    objects_and_instance_names: Dict[str, List[str]] = dict()
+    more_types = scanner.first_member()
+    while more_types:
+        obj_type = scanner.read_string()
+        scanner.expect(_COLON, "':'")
+        name_field = OBJECTS_NAMED_BY_FIELD.get(obj_type)
+        names: Dict[str, str] = dict()
+        more_instances = scanner.first_member()
+        while more_instances:
+            m = _INSTANCE.match(data, scanner.pos)
+            if m:
+                instance_name = m.group(1).decode('utf-8')
+                body_start, body_end = m.span(2)
+                scanner.pos = m.end()
+                more_instances = m.group(3) == b','
+            else:
+                # names with escapes and deeply nested bodies go through the scanner one token at a time
+                instance_name = scanner.read_string()
+                scanner.expect(_COLON, "':'")
+                body_start = scanner.skip_object()
+                body_end = scanner.pos
+                more_instances = scanner.next_member()
+            if name_field:
+                names[instance_name] = loads(bytes(data[body_start:body_end]))[name_field]
+            else:
+                names[instance_name] = instance_name
+        objects_and_instance_names[obj_type] = list(names.values())
+        more_types = scanner.next_member()
+    if scanner.skip_whitespace() != -1:
+        raise scanner.error("unexpected data after the top level object")
+    return objects_and_instance_names
+
+
+def object_names_from_json(data) -> Dict[str, List[str]]:
+    """
+    This function extracts the object types and instance names by loading the whole epJSON contents with json.  It
+    gives the same result as object_names_from_bytes(), and is used for small files.
+    :param data: The epJSON contents, as bytes or str
+    :return: A dict of {object type => [instance names]}, in file order
+    """
+    objects_and_instance_names: Dict[str, List[str]] = dict()
+    for obj_type, instance_dict in loads(data).items():
+        name_field = OBJECTS_NAMED_BY_FIELD.get(obj_type)
+        if name_field:
+            objects_and_instance_names[obj_type] = [fields[name_field] for fields in instance_dict.values()]
+        else:
+            objects_and_instance_names[obj_type] = list(instance_dict)
+    return objects_and_instance_names
+
+
+def read_object_names(epjson_path: Path) -> Dict[str, List[str]]:
+    """
+    This function extracts the object types and instance names from an epJSON file.  Files larger than
+    JSON_LOADS_MAX_BYTES are memory mapped and scanned, smaller ones are loaded with json.
+    :param epjson_path: Path to the epJSON file
+    :return: A dict of {object type => [instance names]}, in file order
+    """
+    with open(str(epjson_path), 'rb') as f:
+        size = fstat(f.fileno()).st_size
+        if size == 0:
+            raise ValueError("Empty epJSON file: " + str(epjson_path))
+        if size <= JSON_LOADS_MAX_BYTES:
+            return object_names_from_json(f.read())
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            return object_names_from_bytes(data)
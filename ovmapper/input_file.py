@@ -1,96 +1,106 @@
-from json import loads
 from pathlib import Path
-from typing import List, Set
+from sys import intern
+from time import perf_counter
+from typing import Dict, List, Optional, Set
 
-from ovmapper.output_variable import OutputVarClassification, OutputVarLine
+from ovmapper.composite import InstanceNameAutomaton
+from ovmapper.epjson import read_object_names
+from ovmapper.metrics import FileMetrics
+from ovmapper.output_variable import OutputVarClassification, OutputVarLine, read_unique_output_var_lines
+from ovmapper.rules import RuleSet, get_rule_set
 
 
 class SingleFile:
 
-    def __init__(self, path_to_output_var_file: Path):
+    def __init__(self, path_to_output_var_file: Path, process_now: bool = True, rules_file: Optional[Path] = None,
+                 dir_entries: Optional[Set[str]] = None, composite_keys: bool = False):
         """
         This constructor takes the path to an output_vars.csv file and validates the path and gets extra data.
         This function tries to carefully find the appropriate epJSON file.  There is one special case where the epJSON
-        won't exist, but all other cases will have an epJSON path.
+        won't exist, but all other cases will have an epJSON path.  Timing and size measurements of the processing are
+        recorded in the metrics member variable.
         :param path_to_output_var_file: pathlib.Path location of the output_vars.csv file for a single run.
+        :param process_now: If True, the output variables are cross referenced immediately, otherwise only the paths are
+                            resolved and the process() method must be called later, possibly in a worker process.
+        :param rules_file: Optional path to a rules JSON file of known gotchas, defaulting to the one in this package
+        :param dir_entries: Optional set of the file names in the run directory, from a listing the caller already did,
+                            so the epJSON candidates are looked up in it instead of checking each one on disk
+        :param composite_keys: If True, keys that are not an instance name are also searched for instance names joined
+                               together, such as {case_name}InZone{zone_name}
         """
         self.keep = True
+        self.rules_file = rules_file
+        self.composite_keys = composite_keys
         self.original_output_var_file = path_to_output_var_file
         self.run_dir_in_build = path_to_output_var_file.parent
         self.idf_base_name = self.run_dir_in_build.name
-        primary_expected_file = self.run_dir_in_build / (self.idf_base_name + '.epJSON')
-        possible_expanded_file = self.run_dir_in_build / 'expanded.epJSON'
-        possible_param_file = self.run_dir_in_build / (self.idf_base_name + '-000001.epJSON')
-        possible_app_g_file = self.run_dir_in_build / (self.idf_base_name + '-G000.epJSON')
+        candidate_files = self.candidate_epjson_names(self.idf_base_name)
+        if dir_entries is None:
+            found_file = next((x for x in candidate_files if (self.run_dir_in_build / x).exists()), None)
+        else:
+            found_file = next((x for x in candidate_files if x in dir_entries), None)
         # Gotcha: skipping the pre-converted epJSON file because the converted file will be IDF, not JSON
         known_skipped_files = ['RefBldgMediumOfficeNew2004_Chicago_epJSON']
-        if primary_expected_file.exists():
-            self.converted_json_file = primary_expected_file
-        elif possible_expanded_file.exists():
-            self.converted_json_file = possible_expanded_file
-        elif possible_param_file.exists():
-            self.converted_json_file = possible_param_file
-        elif possible_app_g_file.exists():
-            self.converted_json_file = possible_app_g_file
+        if found_file is not None:
+            self.converted_json_file = self.run_dir_in_build / found_file
         elif self.idf_base_name in known_skipped_files:
             print("Skipping known-skip file: " + str(self.idf_base_name))
             self.keep = False
         else:
             print("Skipping missing epJSON file: " + str(self.idf_base_name))
             self.keep = False
-        if self.keep:
-            self.output_variable_data = self._cross_reference_vars_and_inputs()
+        self.output_variable_data: List[OutputVarClassification] = list()
+        # set by ResultCache.is_fresh() before processing, so results are cached against the inputs they came from
+        self.input_fingerprint: Optional[list] = None
+        self.metrics = FileMetrics(self.idf_base_name)
+        if self.keep and process_now:
+            self.process()
 
     @staticmethod
-    def _handle_special_var_cases(ov: OutputVarLine, o: Set[str]) -> bool:
+    def candidate_epjson_names(idf_base_name: str) -> List[str]:
+        """
+        Lists the names the epJSON input file of a run can have, in order of preference: the primary expected file, the
+        expanded file, the parametric file, and the appendix G file.
+        :param idf_base_name: Name of the run directory, which is the base name of the original input file
+        :return: The list of candidate epJSON file names
+        """
+        return [
+            idf_base_name + '.epJSON', 'expanded.epJSON', idf_base_name + '-000001.epJSON',
+            idf_base_name + '-G000.epJSON',
+        ]
+
+    def process(self) -> List[OutputVarClassification]:
         """
-        This function handles a series of special cases based on variable information.
+        This function does the expensive work of cross referencing the output variables and input file for this run.
+        It only relies on the resolved paths, so an unprocessed instance can be shipped to a worker process to call
+        this.
+        :return: The list of output variable classifications for this file, which is also stored on this instance.
+        """
+        self.output_variable_data = self._cross_reference_vars_and_inputs()
+        return self.output_variable_data
+
+    @property
+    def rules(self) -> RuleSet:
+        """
+        The compiled rule table of known gotchas, which is loaded once per process from the rules file.
+        :return: A compiled RuleSet instance
+        """
+        return get_rule_set(self.rules_file)
+
+    def _handle_special_var_cases(self, ov: OutputVarLine, o: Set[str]) -> bool:
+        """
+        This function handles a series of special cases based on variable information, such as keys that aren't input
+        objects, node variables, and variables with composite keys.  The cases are listed in the special_cases section
+        of the rules file, and every matching case applies.
         :param ov: The current output variable line, as an OutputVarLine instance
         :param o: The mutable list of objects that could be associated with this output variable
         :return: A boolean flag for whether this situation has been associated and handled
         """
-        var_key = ov.key
-        var_type_name = ov.var_name
         initial_length_of_o = len(o)
-        # Gotcha: Some output variables have keys that do not appear in the IDF, not sure what to call this input type
-        known_non_object_keys = [
-            'Environment', 'Simulation', 'SimHVAC', 'SimAir', 'Whole Building', 'Facility', 'Site', 'ManageDemand',
-        ]
-        if var_key in known_non_object_keys:
-            o.add("*GLOBAL*")
-        # Gotcha: Node and AFN Node variables do not need to have a specific input object
-        if var_type_name.startswith('System Node '):
-            o.add("*NODE*")
-        if var_type_name.startswith('AFN Node '):
-            o.add("*AFN NODE*")
-        # Gotcha: Some objects don't have a name, and the output key is associated with the unique object's type name
-        unnamed_objects_with_object_type_as_key = [
-            'Site:Precipitation', 'RoofIrrigation'
-        ]
-        if var_key in unnamed_objects_with_object_type_as_key:
-            o.add(var_key.upper())
-        # Gotcha: Refrigerated Case variables use a key that is a concatenation of: "{case_name}InZone{zone_name}"
-        if var_type_name.startswith("Refrigeration Walk In"):
-            o.add("REFRIGERATION:WALKIN")
-        # Gotcha: Int gain vars that use a zone list instead of a single zone name have name like "{zone_name} {people}"
-        internal_gain_zone_list_shared_vars = ['People', 'Lights', 'Electric Equipment', 'Hot Water Equipment']
-        for v in internal_gain_zone_list_shared_vars:
-            if var_type_name.startswith(v + ' '):
-                o.add(v.replace(' ', '').upper())
-        # Gotcha: Performance curve output variables are associated with any curve type
-        if var_type_name.startswith('Performance Curve '):
-            o.add("*CURVE OR TABLE*")
-        # Gotcha: Enclosure stuff is formed a little different too
-        enclosure_vars_with_funny_keys = [
-            'Daylighting Window Reference Point ', 'Zone Windows Total ',
-            'Zone Interior Windows Total ', 'Zone Exterior Windows Total '
-        ]
-        if any([var_type_name.startswith(x) for x in enclosure_vars_with_funny_keys]):
-            o.add("*ENCLOSURES*")
+        o.update(self.rules.special_case_types(ov.var_name, ov.key))
         return len(o) > initial_length_of_o
 
-    @staticmethod
-    def _handle_gotchas_because_of_instance_names(var_name: str, o: Set[str]) -> bool:
+    def _handle_gotchas_because_of_instance_names(self, var_name: str, o: Set[str]) -> bool:
         """
         This function quickly maps some known variables primarily because of naming problems in the input files.
         This project is based around mining the output variables requested during a simulation then matching up the
@@ -98,96 +108,128 @@ class SingleFile:
         In a number of example files, the zone name is used to name every internal gain in the zone.  For example:
         Zone, ZoneA, ...;  Lights, ZoneA, ...; People, ZoneA, ...;
         While this is not a problem for EnergyPlus, it does mean we cannot disambiguate the association, so this
-        function does it in a brute force way.
+        function does it in a brute force way using the instance_name_gotchas section of the rules file.
         :param var_name: The name of the output variable: Zone Air Drybulb Temperature
         :param o: The mutable list of objects that could be associated with this output variable
         :return: A boolean flag for whether this variable name has been associated and handled
         """
         initial_length_of_o = len(o)
-        if var_name.startswith('Zone '):  # Internal gains often named the same: Zone, Lights, People
-            o.add('ZONE')
-        elif var_name.startswith('People '):  # Internal gains often named the same: Zone, Lights, People
-            o.add('PEOPLE')
-        elif var_name.startswith('Lights '):  # Internal gains often named the same: Zone, Lights, People
-            o.add('LIGHTS')
-        elif var_name.startswith('Air System '):  # often associated with AirLoopHVAC and AirLoopHVAC:SupplyPath
-            o.add('AIRLOOPHVAC')
-        elif var_name.startswith('Water Use '):  # often associated with WaterUse:Equipment and WaterUse:Connections
-            o.add('WATERUSE:EQUIPMENT')
-        elif var_name.startswith('Steam Equipment '):  # steam and elec equipment named the same - 5ZoneWaterSystems
-            o.add('STEAMEQUIPMENT')
-        elif var_name.startswith('Fluid Heat Exchanger '):  # HX and SP Manager named the same - FreeCoolingChiller
-            o.add('HEATEXCHANGER:FLUIDTOFLUID')
-        elif var_name.startswith('Electric Load Center '):  # Generator and dist same name - GeneratorWithWindTurbine
-            o.add('ElectricLoadCenter:Distribution')
-        elif var_name.startswith('Room Air Zone '):  # Zone name used for room air model and others - UserDefRoomAirPatt
-            o.add('ZONE')
-        elif var_name.startswith('RoomAirflowNetwork Node '):  # RoomAirNode and Intrazone node - RoomAirflowNetwork
-            o.add('ROOMAIR:NODE:AIRFLOWNETWORK')
-        elif var_name.startswith('Refrigeration Zone Case and Walk In'):
-            # zone, people given same name in ASHRAE9012016_RestaurantFastFood_Denver - should just be a zone
-            o.add('ZONE')
-        elif var_name.startswith('Surface Other Side Conditions '):
-            # Surface Prop Other side Conditions Model and Surface Prop * named the same, just use the OSCM
-            o.add('SURFACEPROPERTY:OTHERSIDECONDITIONSMODEL')
-        elif var_name.startswith('Schedule Value'):
-            # schedule:day:hourly and schedule:year given the same name in HAMT_DailyProfileReport, but it maps to four
-            o.add('SCHEDULE:YEAR')
-            o.add('SCHEDULE:COMPACT')
-            o.add('SCHEDULE:FILE')
-            o.add('SCHEDULE:CONSTANT')
-        elif var_name.startswith('Unitary System '):  # AirLoop Unitary object and AirLoopHVAC sometimes named the same
-            o.add('*UNITARY*')
-        elif var_name.startswith('Availability Manager Hybrid Ventilation Control '):
-            # given the same name with people and zone in FanCoil_HybridVent_VentSch, but really it maps to two objects
-            o.add('AIRLOOPHVAC')
-            o.add('ZONE')
+        o.update(self.rules.instance_name_gotcha_types(var_name))
         return len(o) > initial_length_of_o
 
+    @staticmethod
+    def _build_instance_name_index(objects_and_instance_names: Dict[str, List[str]]) -> Dict[str, Set[str]]:
+        """
+        This function builds a lookup of upper case instance name to all the upper case object types that use that name,
+        so that matching an output variable key against the input file is a single dict lookup.
+        :param objects_and_instance_names: A dict of {object type => [instance names]} from the epJSON file
+        :return: A dict of {upper case instance name => set of upper case object types}
+        """
+        index: Dict[str, Set[str]] = dict()
+        for obj_type, instance_names in objects_and_instance_names.items():
+            upper_obj_type = intern(obj_type.upper())
+            if upper_obj_type.startswith(('COMPONENTCOST', 'ENERGYMANAGEMENT')):
+                # Gotcha: ComponentCost is not associated with a report variable, but is sometimes named
+                #         the same as the associated input objects, so need to just skip this variable
+                # Gotcha: EnergyManagementSystem:OutputVariable objects are all custom, not linked to one input
+                continue
+            for instance_name in instance_names:
+                upper_name = instance_name.upper()
+                if upper_name in index:
+                    index[upper_name].add(upper_obj_type)
+                else:
+                    index[upper_name] = {upper_obj_type}
+        return index
+
+    def _handle_composite_key(self, key: str, instance_name_index: Dict[str, Set[str]],
+                              automaton: InstanceNameAutomaton, o: Set[str]) -> bool:
+        """
+        This function resolves keys that are made by joining instance names together, such as
+        {case_name}InZone{zone_name} for refrigerated cases or {zone_name} {people_name} for internal gains defined with
+        a zone list.  The key is only resolved if the whole of it can be read as instance names separated by the joiners
+        from the rules file, so a key that merely contains an instance name, such as ZONE 18 containing ZONE 1, is left
+        alone.  The context types from the rules file (zones and the like) are dropped if any other object is named in
+        the key.
+        :param key: The upper case output variable key
+        :param instance_name_index: A dict of {upper case instance name => set of upper case object types}
+        :param automaton: The automaton over the instance names of this file
+        :param o: The mutable list of objects that could be associated with this output variable
+        :return: A boolean flag for whether any object types were found
+        """
+        found_types: Set[str] = set()
+        for name in automaton.tiling_names(key, self.rules.composite_joiners):
+            found_types.update(instance_name_index[name])
+        other_types = found_types - self.rules.composite_context_types
+        o.update(other_types or found_types)
+        return bool(found_types)
+
     def _cross_reference_vars_and_inputs(self) -> List[OutputVarClassification]:
         """
-        This function takes a single output_vars generated csv file and parses it into a list of output variable data.
-        Then it takes the epJSON representation of the input file and gathers a small dict of object {type => instance}
+        This function takes a single output_vars generated csv file and bulk loads the unique output variable data.
+        Then it streams through the epJSON representation of the input file to gather a small dict of object
+        {type => instance} without decoding any of the instance fields, which is indexed by upper case instance name.
         It then loops over all output variables and tries to find the input object that matches the output variable by
-        matching the output variable key with an input object instance name.  There are a couple dozen gotchas that are
+        looking up the output variable key in that instance name index.  There are a couple dozen gotchas that are
         handled along the way because of object naming problems, output variable corner cases, etc.
         :return: A list of output variable classes, which contain the full set of likely input objects for each var.
         """
-        all_output_vars_this_file = list()
-        var_name_list = list()
-        with open(str(self.original_output_var_file)) as f:
-            for line in f.readlines():
-                if line.strip():
-                    var = OutputVarLine(line)
-                    if var.keep and var.var_name not in var_name_list:
-                        var_name_list.append(var.var_name)
-                        all_output_vars_this_file.append(var)
-        with open(str(self.converted_json_file)) as f:
-            input_file_object = loads(f.read())
-        objects_and_instance_names = dict()
-        for obj_type, instance_dict in input_file_object.items():
-            names = list()
-            for instance_name, instance_fields in instance_dict.items():
-                # Gotcha: The newer VRF object does not have a name, it uses heat_pump_name
-                if obj_type == 'AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl':
-                    names.append(instance_fields['heat_pump_name'])
-                else:
-                    names.append(instance_name)
-            objects_and_instance_names[obj_type] = names
+        t_start = perf_counter()
+        all_output_vars_this_file = self._load_output_vars()
+        t_csv = perf_counter()
+        objects_and_instance_names = self._load_input_objects()
+        t_epjson = perf_counter()
+        classifications = self._match_vars_to_objects(all_output_vars_this_file, objects_and_instance_names)
+        t_match = perf_counter()
+        self.metrics.csv_time = t_csv - t_start
+        self.metrics.epjson_time = t_epjson - t_csv
+        self.metrics.match_time = t_match - t_epjson
+        self.metrics.csv_bytes = self.original_output_var_file.stat().st_size
+        self.metrics.epjson_bytes = self.converted_json_file.stat().st_size
+        self.metrics.num_vars = len(classifications)
+        self.metrics.num_instances = sum(len(names) for names in objects_and_instance_names.values())
+        return classifications
+
+    def _load_output_vars(self) -> List[OutputVarLine]:
+        """
+        This function loads the unique, non-EMS output variables from the output_vars.csv file.
+        :return: A list of OutputVarLine instances
+        """
+        return read_unique_output_var_lines(self.original_output_var_file)
+
+    def _load_input_objects(self) -> Dict[str, List[str]]:
+        """
+        This function gathers the object types and instance names from the epJSON file.
+        :return: A dict of {object type => [instance names]}
+        """
+        return read_object_names(self.converted_json_file)
+
+    def _match_vars_to_objects(self, all_output_vars_this_file: List[OutputVarLine],
+                               objects_and_instance_names: Dict[str, List[str]]) -> List[OutputVarClassification]:
+        """
+        This function classifies each output variable, first through the known gotchas, and otherwise by looking up the
+        output variable key in the instance name index of the input file.  If composite key matching is on, keys that
+        are not an instance name are then searched for the instance names they are made of.
+        :param all_output_vars_this_file: The unique output variables from the output_vars.csv file
+        :param objects_and_instance_names: A dict of {object type => [instance names]} from the epJSON file
+        :return: A list of output variable classes, which contain the full set of likely input objects for each var.
+        """
+        instance_name_index = self._build_instance_name_index(objects_and_instance_names)
+        # only built for the first key that is not an instance name, since most files never need it
+        automaton: Optional[InstanceNameAutomaton] = None
         classifications = []
         for output_var in all_output_vars_this_file:
             o = OutputVarClassification(output_var.var_name.upper())
             if self._handle_special_var_cases(output_var, o.possible_input_objects):
                 continue
             if not self._handle_gotchas_because_of_instance_names(output_var.var_name, o.possible_input_objects):
-                for obj_type, instance_names in objects_and_instance_names.items():
-                    if obj_type.upper().startswith('COMPONENTCOST') or obj_type.upper().startswith('ENERGYMANAGEMENT'):
-                        # Gotcha: ComponentCost is not associated with a report variable, but is sometimes named
-                        #         the same as the associated input objects, so need to just skip this variable
-                        # Gotcha: EnergyManagementSystem:OutputVariable objects are all custom, not linked to one input
-                        continue
-                    for instance_name in instance_names:
-                        if instance_name.upper() == output_var.key.upper():
-                            o.possible_input_objects.add(obj_type.upper())
+                upper_key = output_var.key.upper()
+                matching_object_types = instance_name_index.get(upper_key)
+                if matching_object_types:
+                    o.possible_input_objects.update(matching_object_types)
+                elif self.composite_keys:
+                    if automaton is None:
+                        min_length = self.rules.composite_min_name_length
+                        automaton = InstanceNameAutomaton(x for x in instance_name_index if len(x) >= min_length)
+                    self._handle_composite_key(upper_key, instance_name_index, automaton, o.possible_input_objects)
             classifications.append(o)
         return classifications
@@ -0,0 +1,196 @@
+from json import dumps
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional
+
+
+class FileMetrics:
+    """
+    This class holds the measurements for processing a single test directory.  It is filled in by SingleFile while it
+    processes the file, which may be in a worker process, so it is a small picklable record.
+    """
+
+    __slots__ = ('test_dir', 'csv_bytes', 'csv_time', 'epjson_bytes', 'epjson_time', 'match_time', 'num_vars',
+                 'num_instances', 'from_cache')
+
+    def __init__(self, test_dir: str, from_cache: bool = False):
+        """
+        This constructor creates an empty set of measurements for a test directory.
+        :param test_dir: Name of the test directory
+        :param from_cache: True if the results came from the result cache rather than being processed
+        """
+        self.test_dir = test_dir
+        self.csv_bytes = 0
+        self.csv_time = 0.0
+        self.epjson_bytes = 0
+        self.epjson_time = 0.0
+        self.match_time = 0.0
+        self.num_vars = 0
+        self.num_instances = 0
+        self.from_cache = from_cache
+
+    @property
+    def parse_time(self) -> float:
+        """
+        The time spent reading and parsing both input files.
+        :return: The parse time in seconds
+        """
+        return self.csv_time + self.epjson_time
+
+    @property
+    def total_time(self) -> float:
+        """
+        The total time spent processing this file.
+        :return: The total time in seconds
+        """
+        return self.parse_time + self.match_time
+
+    def to_object(self) -> dict:
+        """
+        Converts this object instance into a dict() for JSON serialization.
+        :return: A dict of all the measurements
+        """
+        return {
+            'test_dir': self.test_dir, 'from_cache': self.from_cache, 'total_time': self.total_time,
+            'parse_time': self.parse_time, 'match_time': self.match_time, 'csv_time': self.csv_time,
+            'csv_bytes': self.csv_bytes, 'epjson_time': self.epjson_time, 'epjson_bytes': self.epjson_bytes,
+            'num_vars': self.num_vars, 'num_instances': self.num_instances,
+        }
+
+
+class MapperObserver:
+    """
+    This class is the base for hooks that get notified while OutputVariableMapper runs.  All of the methods do nothing
+    here, so subclasses only need to override the ones they care about.
+    """
+
+    def file_processed(self, metrics: FileMetrics, num_done: int, num_files: int) -> None:
+        """
+        Called after each file has been processed, or loaded from the cache, and merged into the aggregate.
+        :param metrics: The measurements for the file
+        :param num_done: The number of files done so far, including this one
+        :param num_files: The total number of files to be done
+        :return: Nothing
+        """
+        pass
+
+    def stage_finished(self, stage: str, seconds: float) -> None:
+        """
+        Called when a whole stage of the mapping finishes.
+        :param stage: The name of the stage: discovery, processing, down_select, invert or dump
+        :param seconds: The wall time of the stage in seconds
+        :return: Nothing
+        """
+        pass
+
+
+class ProgressReporter(MapperObserver):
+    """
+    This observer prints a progress line, but at most once every interval so that printing doesn't slow down runs over
+    huge build trees.  The last file always gets a line, at the latest when the processing stage finishes, since the
+    total number of files is only an estimate while the discovery is still running.
+    """
+
+    def __init__(self, min_interval: float = 1.0):
+        """
+        This constructor sets the reporting interval.
+        :param min_interval: Minimum number of seconds between progress lines
+        """
+        self.min_interval = min_interval
+        self.t_initial = None
+        self.t_last_report = 0.0
+        self.unreported_line: Optional[str] = None
+
+    def file_processed(self, metrics: FileMetrics, num_done: int, num_files: int) -> None:
+        """
+        Prints a progress line if enough time has passed since the last one.
+        :param metrics: The measurements for the file
+        :param num_done: The number of files done so far, including this one
+        :param num_files: The total number of files to be done
+        :return: Nothing
+        """
+        t_now = time()
+        if self.t_initial is None:
+            self.t_initial = t_now
+        self.unreported_line = "Processed file # %i/%i (total time = %is) - \"%s\"" % (
+            num_done, num_files, round(t_now - self.t_initial), metrics.test_dir
+        )
+        if num_done == num_files or t_now - self.t_last_report >= self.min_interval:
+            self.t_last_report = t_now
+            print(self.unreported_line)
+            self.unreported_line = None
+
+    def stage_finished(self, stage: str, seconds: float) -> None:
+        """
+        Prints the progress line of the last file when the processing finishes, if it was not printed yet.
+        :param stage: The name of the stage
+        :param seconds: The wall time of the stage in seconds
+        :return: Nothing
+        """
+        if stage == 'processing' and self.unreported_line is not None:
+            print(self.unreported_line)
+            self.unreported_line = None
+
+
+class MetricsRecorder(MapperObserver):
+    """
+    This observer keeps the measurements of every file and the timing of every stage, and can write them out as a JSON
+    report, with the files sorted by processing time so the ones dominating the runtime are listed first.
+    """
+
+    def __init__(self):
+        """
+        This constructor creates an empty recorder.
+        """
+        self.file_metrics: List[FileMetrics] = list()
+        self.stage_times: Dict[str, float] = dict()
+
+    def file_processed(self, metrics: FileMetrics, num_done: int, num_files: int) -> None:
+        """
+        Keeps the measurements for a file.
+        :param metrics: The measurements for the file
+        :param num_done: The number of files done so far, including this one
+        :param num_files: The total number of files to be done
+        :return: Nothing
+        """
+        self.file_metrics.append(metrics)
+
+    def stage_finished(self, stage: str, seconds: float) -> None:
+        """
+        Keeps the timing of a stage, adding it up if the stage runs more than once.
+        :param stage: The name of the stage
+        :param seconds: The wall time of the stage in seconds
+        :return: Nothing
+        """
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+
+    def to_object(self) -> dict:
+        """
+        Converts the recorded measurements into a dict() for JSON serialization.
+        :return: A dict with the stage timings, totals over all files, and the per-file measurements
+        """
+        processed = [m for m in self.file_metrics if not m.from_cache]
+        return {
+            'stages': self.stage_times,
+            'totals': {
+                'num_files': len(self.file_metrics),
+                'num_from_cache': len(self.file_metrics) - len(processed),
+                'csv_time': sum(m.csv_time for m in processed),
+                'csv_bytes': sum(m.csv_bytes for m in processed),
+                'epjson_time': sum(m.epjson_time for m in processed),
+                'epjson_bytes': sum(m.epjson_bytes for m in processed),
+                'match_time': sum(m.match_time for m in processed),
+                'num_vars': sum(m.num_vars for m in self.file_metrics),
+            },
+            'files': [m.to_object() for m in sorted(self.file_metrics, key=lambda m: m.total_time, reverse=True)],
+        }
+
+    def write_report(self, report_path: Path) -> None:
+        """
+        Writes the JSON metrics report.
+        :param report_path: Path of the JSON report to write
+        :return: Nothing
+        """
+        print("Creating metrics report at %s" % report_path)
+        with open(str(report_path), 'w') as f:
+            f.write(dumps(self.to_object(), indent=2))
@@ -1,4 +1,21 @@
-from typing import Union, Set
+from itertools import compress, repeat
+from mmap import mmap, ACCESS_READ
+from operator import add, itemgetter, ne
+from os import fstat
+from pathlib import Path
+from re import compile, MULTILINE
+from sys import intern
+from typing import Iterable, List, Union, Set
+
+# One row per line with at least four fields: name, units, time step, key; whitespace at the start and end of the line
+# is left out like strip().  The key group stops before trailing whitespace, and the fifth group holds that whitespace
+# only when another field follows, since strip() never touched it there
+_CSV_ROW = compile(
+    rb'^[ \t\r\f\v]*([^,\n]*),([^,\n]*),([^,\n]*),([^,\s]*(?:[ \t\r\f\v]+[^,\s]+)*)([ \t\r\f\v]+(?=,))?', MULTILINE
+)
+_LINE_END = compile(rb'\n')
+# Non-blank lines that do not have four fields
+_MALFORMED_ROW = compile(rb'^[ \t\r\f\v]*(?![^,\n]*,[^,\n]*,[^,\n]*,)([^\s][^\n]*)', MULTILINE)
 
 
 class OutputVarLine:
@@ -7,6 +24,8 @@ class OutputVarLine:
     during a simulation run
     """
 
+    __slots__ = ('keep', 'var_name', 'units', 'time_step', 'key')
+
     def __init__(self, line: str):
         """
         This constructor will simply parse a CSV line from the output_vars.csv file, and assign values to member
@@ -28,11 +47,83 @@ class OutputVarLine:
             print("Reason: " + str(e))
             self.keep = False
 
+    @classmethod
+    def from_fields(cls, var_name: str, units: str, time_step: str, key: str) -> 'OutputVarLine':
+        """
+        This creates an instance from already split fields, skipping the line parsing.
+        :param var_name: The output variable name
+        :param units: The output variable units
+        :param time_step: The time step type of the output variable
+        :param key: The output variable key, usually an input object name
+        :return: A new OutputVarLine instance
+        """
+        line = cls.__new__(cls)
+        line.keep = key != 'EMS'
+        line.var_name = intern(var_name)
+        line.units = units
+        line.time_step = time_step
+        line.key = key
+        return line
+
+
+def read_unique_output_var_lines(output_var_file: Path) -> List[OutputVarLine]:
+    """
+    This function loads an output_vars.csv file and returns the first non-EMS line for each unique output variable name.
+    The file is memory mapped and split into columns in bulk, EMS rows are dropped and duplicates are removed with a
+    dict keyed on variable name, so OutputVarLine instances are only created for the surviving unique variables.
+    :param output_var_file: Path to the output_vars.csv file
+    :return: A list of OutputVarLine instances, in order of first appearance in the file
+    """
+    with open(str(output_var_file), 'rb') as f:
+        if fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            rows = _CSV_ROW.findall(data)
+            num_lines = len(_LINE_END.findall(data)) + (0 if data[-1:] == b'\n' else 1)
+            # only look for malformed lines when some lines did not produce a row, which is rarely the case
+            malformed_rows = _MALFORMED_ROW.findall(data) if len(rows) < num_lines else []
+    for line in malformed_rows:
+        print("Could not process output var CSV line: \"" + line.decode('utf-8', 'replace') + "\"")
+        print("Reason: expected at least four comma separated fields: name, units, time step, key")
+    if not rows:
+        return []
+    names, units, time_steps, keys, key_spaces = zip(*rows)
+    if any(key_spaces):
+        keys = tuple(map(add, keys, key_spaces))
+    kept_rows = list(compress(range(len(keys)), map(ne, keys, repeat(b'EMS'))))
+    if not kept_rows:
+        return []
+    kept_names = itemgetter(*kept_rows)(names) if len(kept_rows) > 1 else (names[kept_rows[0]],)
+    # zipping in reverse leaves each name pointing at its first row
+    first_row_of_name = dict(zip(reversed(kept_names), reversed(kept_rows)))
+    return [
+        OutputVarLine.from_fields(
+            names[i].decode('utf-8', 'replace'), units[i].decode('utf-8', 'replace'),
+            time_steps[i].decode('utf-8', 'replace'), keys[i].decode('utf-8', 'replace')
+        )
+        for i in sorted(first_row_of_name.values())
+    ]
+
+
+def intern_types(object_types: Iterable[str]) -> Set[str]:
+    """
+    Builds a set of object type names using the interned copy of each string, so that the same few thousand type names
+    are shared by every classification rather than duplicated per file.
+    :param object_types: An iterable of object type names
+    :return: A new set of interned object type names
+    """
+    return {intern(t) for t in object_types}
+
 
 class OutputVarClassification:
     """
     This class represents an output variable and all input objects that are (likely) associated with this output.
+    There are a lot of these alive at once, so the class uses __slots__, and the variable name is interned.  Object
+    type names should be interned by whoever adds them, which is also done when unpickling results from a worker.
     """
+
+    __slots__ = ('output_variable_name', 'possible_input_objects')
+
     def __init__(self, output_variable_name: str, found_types: Union[None, Set[str]] = None):
         """
         This constructor takes the variable name for direct assignment, and then optionally a list of already found
@@ -41,12 +132,28 @@ class OutputVarClassification:
         :param found_types: If not passed in, a new set() is created, but if a list is passed in, it is used to
                             initialize a new list with this starting point.
         """
-        self.output_variable_name = output_variable_name
+        self.output_variable_name = intern(output_variable_name)
         if found_types:
             self.possible_input_objects = found_types
         else:
             self.possible_input_objects = set()
 
+    def __getstate__(self) -> tuple:
+        """
+        Gets the state for pickling, as a plain tuple since there is no instance dict.
+        :return: A tuple of the variable name and the set of object types
+        """
+        return self.output_variable_name, self.possible_input_objects
+
+    def __setstate__(self, state: tuple) -> None:
+        """
+        Restores the state after unpickling, interning the strings again since pickling loses that.
+        :param state: A tuple of the variable name and the set of object types
+        :return: Nothing
+        """
+        self.output_variable_name = intern(state[0])
+        self.possible_input_objects = intern_types(state[1])
+
     def __str__(self) -> str:
         """
         Simple debugging descriptor method.
@@ -57,6 +164,6 @@ class OutputVarClassification:
     def to_object(self) -> dict:
         """
         Converts this object instance into a dict() for JSON serialization.
-        :return: A dict with the variable name as the key and a plain Python list holding the input object type names.
+        :return: A dict with the variable name as the key and a sorted Python list holding the input object type names.
         """
-        return {self.output_variable_name: list(self.possible_input_objects)}
+        return {self.output_variable_name: sorted(self.possible_input_objects)}
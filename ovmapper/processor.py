@@ -1,10 +1,29 @@
-from json import dumps
+from collections import deque
+from json import dumps, loads
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
 from pathlib import Path
-from time import time
-from typing import Dict, List, Set
+from time import perf_counter, sleep
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from ovmapper.cache import ResultCache
+from ovmapper.discovery import FileDiscovery, TestDirWatcher
 from ovmapper.input_file import SingleFile
-from ovmapper.output_variable import OutputVarClassification
+from ovmapper.metrics import FileMetrics, MapperObserver, ProgressReporter
+from ovmapper.output_variable import OutputVarClassification, intern_types
+from ovmapper.provenance import Provenance
+from ovmapper.query import write_index
+from ovmapper.rules import get_rule_set
+
+
+def _process_in_worker(single_file: SingleFile) -> Tuple[List[OutputVarClassification], FileMetrics]:
+    """
+    This is the worker process entry point for parallel runs.  The unprocessed SingleFile only carries resolved paths
+    so it is cheap to send over, and only the picklable classifications and metrics are sent back to the parent process.
+    :param single_file: A SingleFile instance created with process_now=False
+    :return: The list of output variable classifications for this file, and the measurements from processing it
+    """
+    return single_file.process(), single_file.metrics
 
 
 class OutputVariableMapper:
@@ -13,28 +32,100 @@ class OutputVariableMapper:
     an output variable "schema".  For now, this is just a list of a mapping between input objects and output variable
     names so that interfaces can use this information to figure out what output variables are available for different
     input objects prior to a simulation.
+    Results are merged into a running {output variable => object types} aggregate as each file is processed, and the
+    per-file data is dropped afterwards, so memory does not grow with the number of test directories.
+    The work can also be split across machines: each one processes a shard of the test directories and writes a partial
+    result file with dump_partial_results(), and from_partial_results() merges any number of them into the final maps.
     """
 
-    def __init__(self, path_to_build_dir: Path):
+    # Bump this whenever the partial result file layout changes
+    partial_results_version = 1
+
+    def __init__(self, path_to_build_dir: Optional[Path], num_workers: int = 1, cache_file: Optional[Path] = None,
+                 rules_file: Optional[Path] = None, process: bool = True, test_dirs: Optional[List[str]] = None,
+                 shard: Optional[Tuple[int, int]] = None, observers: Optional[List[MapperObserver]] = None,
+                 track_provenance: bool = False, composite_keys: bool = False):
         """
         This constructor takes the path to a build directory and processes output variable map files.
         :param path_to_build_dir: Path to a build directory where the build was created using the `GenerateReportSchema`
-                                  branch and `ctest -R "integration*"` has been executed
+                                  branch and `ctest -R "integration*"` has been executed, which can be None only if
+                                  process is False, such as when merging partial result files
+        :param num_workers: Number of worker processes used to process files, with 1 meaning a serial run here
+        :param cache_file: Optional path to a persistent result cache, so unchanged test directories are not processed
+                           again
+        :param rules_file: Optional path to a rules JSON file of known gotchas, defaulting to the one in this package
+        :param process: If True, all files are processed right away, otherwise the caller can consume iter_files() to
+                        get each file lazily, and then call finalize() to build the final mappings, or call follow() to
+                        process the files while the tests are still running
+        :param test_dirs: Optional list of test directory names to process, instead of every directory in testfiles
+        :param shard: Optional (index, count) pair to only process every count-th directory of the sorted directory
+                      list starting at index, so that count machines can each process one shard of the build
+        :param observers: Optional list of MapperObserver hooks that are notified of per-file metrics and stage timings,
+                          defaulting to a rate limited ProgressReporter
+        :param track_provenance: If True, the test directories that produced each (output variable, object type) pair
+                                 are recorded in the provenance member variable, and dumped along with the maps
+        :param composite_keys: If True, output variable keys that are not an instance name are also searched for the
+                               instance names they are made of, such as {case_name}InZone{zone_name}
 
         """
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError("Invalid shard index %i for a shard count of %i" % shard)
         self.build_dir = path_to_build_dir
-        self.all_files = self._get_all_applicable_files()
+        self.num_workers = num_workers
+        self.rules_file = rules_file
+        self.composite_keys = composite_keys
+        self.test_dirs = test_dirs
+        self.shard = shard
+        self.processed_dirs: List[str] = list()
+        self.observers = [ProgressReporter()] if observers is None else observers
+        # composite key matching changes the results, so it has to be part of the cache signature
+        rules_signature = get_rule_set(rules_file).signature + (':composite_keys' if composite_keys else '')
+        self.cache = ResultCache(cache_file, rules_signature) if cache_file else None
+        self.output_variable_objects: Dict[str, Set[str]] = dict()
+        self.final_mapping: List[OutputVarClassification] = list()
+        self.inverted_map: Dict[str, List[str]] = dict()
+        self.provenance = Provenance() if track_provenance else None
+        if process:
+            for _ in self.iter_files():
+                pass
+            self.finalize()
+
+    def finalize(self) -> None:
+        """
+        Builds the final output variable mapping and the inverted object mapping from the running aggregate.  Both are
+        sorted, so the result only depends on the aggregate and not on the order the files were processed in.
+        :return: Nothing
+        """
+        t_start = perf_counter()
         self.final_mapping = self._down_select_object_types()
+        t_down_select = perf_counter()
         self.inverted_map = self._invert_mapping()
+        self._stage_finished('down_select', t_down_select - t_start)
+        self._stage_finished('invert', perf_counter() - t_down_select)
+
+    def _stage_finished(self, stage: str, seconds: float) -> None:
+        """
+        Notifies all observers that a stage has finished.
+        :param stage: The name of the stage
+        :param seconds: The wall time of the stage in seconds
+        :return: Nothing
+        """
+        for observer in self.observers:
+            observer.stage_finished(stage, seconds)
 
     def dump_results(self, output_dir: Path) -> None:
         """
-        Dumps mapping results files to the output directory specified
+        Dumps mapping results files to the output directory specified.  Along with the two JSON maps, this writes a
+        binary index of both directions that can be queried with ovmapper.query.MappingIndex without loading the JSON,
+        and the provenance of each pair if it was tracked, which can be queried with ovmapper.provenance.Provenance.
         :param output_dir: The output directory to dump the map files
         :return: Nothing
         """
         ov_to_object_path = output_dir / 'output_var_to_object_map.json'
         object_to_ov_path = output_dir / 'object_to_output_var_map.json'
+        index_path = output_dir / 'output_var_object_map.idx'
+        provenance_path = output_dir / 'output_var_provenance.json'
+        t_start = perf_counter()
         print("Creating OV->OBJECT map at %s" % ov_to_object_path)
         with open(str(ov_to_object_path), 'w') as f:
             json_data = {'OutputVariables': [x.to_object() for x in self.final_mapping]}
@@ -45,47 +136,263 @@ class OutputVariableMapper:
             json_data = {'OutputVariables': self.inverted_map}
             json_string = dumps(json_data, indent=2)
             f.write(json_string)
+        print("Creating binary lookup index at %s" % index_path)
+        write_index(index_path, {x.output_variable_name: x.possible_input_objects for x in self.final_mapping})
+        if self.provenance:
+            print("Creating provenance file at %s" % provenance_path)
+            self.provenance.dump(provenance_path)
+        self._stage_finished('dump', perf_counter() - t_start)
 
-    def _get_all_applicable_files(self) -> List[SingleFile]:
-        """
-        This function finds all folders in the build directory that include an output_vars.csv file, as this is the clue
-        that this file was run with the special branch and has output variable data to process.  This only adds the file
-        to the master list if the file is valid (the file .keep flag is true)
-        :return: A list of SingleFile instances, all with an output_vars.csv path and an epJSON input file path.
-        """
-        s: List[SingleFile] = list()
-        test_file_dir = self.build_dir / 'testfiles'
-        i = 0
-        t_initial = time()
-        test_dirs = [x for x in test_file_dir.iterdir() if x.is_dir()]
-        num_dirs = len(test_dirs)
-        for test_dir in test_dirs:
-            i += 1
-            t_passed = time() - t_initial
-            print("Processing dir # %i/%i (total time = %is) - \"%s\"" % (i, num_dirs, round(t_passed), test_dir.name))
-            output_var_path = test_dir / 'output_vars.csv'
-            if output_var_path.exists():
-                f = SingleFile(output_var_path)
-                if f.keep:
-                    s.append(f)
-        return s
+    def dump_partial_results(self, partial_path: Path) -> None:
+        """
+        Dumps the running aggregate to a partial result file, to be merged with the results of other shards later.
+        :param partial_path: Path of the partial result file to write
+        :return: Nothing
+        """
+        print("Creating partial results file at %s" % partial_path)
+        with open(str(partial_path), 'w') as f:
+            json_data = {
+                'version': self.partial_results_version,
+                'test_dirs': self.processed_dirs,
+                'OutputVariables': {k: sorted(v) for k, v in self.output_variable_objects.items()},
+            }
+            if self.provenance:
+                json_data['provenance'] = self.provenance.to_object()
+            f.write(dumps(json_data))
+
+    def merge_partial_results(self, partial_path: Path) -> None:
+        """
+        Merges a partial result file into the running aggregate.
+        :param partial_path: Path of a partial result file written by dump_partial_results()
+        :return: Nothing
+        """
+        with open(str(partial_path)) as f:
+            json_data = loads(f.read())
+        if json_data.get('version') != self.partial_results_version:
+            raise ValueError("Unsupported partial results file version in %s" % partial_path)
+        already_processed = set(self.processed_dirs)
+        for test_dir in json_data['test_dirs']:
+            if test_dir in already_processed:
+                print("Test dir \"%s\" appears in more than one partial results file" % test_dir)
+            else:
+                self.processed_dirs.append(test_dir)
+        for var_name, object_types in json_data['OutputVariables'].items():
+            self._merge_classification(OutputVarClassification(var_name, intern_types(object_types)))
+        if self.provenance:
+            if 'provenance' in json_data:
+                self.provenance.merge_object(json_data['provenance'])
+            else:
+                print("Partial results file %s has no provenance, its test dirs will be missing from it" % partial_path)
+
+    @classmethod
+    def from_partial_results(cls, partial_paths: Iterable[Path],
+                             track_provenance: bool = False) -> 'OutputVariableMapper':
+        """
+        Creates a mapper from any number of partial result files, with the final mappings ready to dump.
+        :param partial_paths: Paths of partial result files written by dump_partial_results()
+        :param track_provenance: If True, the provenance in the partial result files is merged too
+        :return: A finalized OutputVariableMapper instance
+        """
+        mapper = cls(None, process=False, track_provenance=track_provenance)
+        for partial_path in partial_paths:
+            print("Merging partial results file at %s" % partial_path)
+            mapper.merge_partial_results(partial_path)
+        mapper.finalize()
+        return mapper
+
+    def _discover_files(self) -> FileDiscovery:
+        """
+        This function sets up the discovery of all folders in the build directory that include an output_vars.csv file,
+        as this is the clue that this file was run with the special branch and has output variable data to process.
+        Only valid files (the file .keep flag is true) are found, and the files are not processed yet.  Directories are
+        sorted by name, and then filtered down to the requested test dirs or shard, if any.
+        :return: A FileDiscovery instance that yields the files as they are found when iterated
+        """
+        return FileDiscovery(
+            self.build_dir / 'testfiles', test_dirs=self.test_dirs, shard=self.shard, rules_file=self.rules_file,
+            cache=self.cache, composite_keys=self.composite_keys
+        )
+
+    def _find_applicable_files(self) -> Deque[SingleFile]:
+        """
+        This function runs the whole discovery up front, for callers that want every file before processing any.
+        :return: A deque of SingleFile instances, all with an output_vars.csv path and an epJSON input file path.
+        """
+        return deque(f for f, _ in self._discover_files())
+
+    def _process_files(self, discovered: Iterable[Optional[Tuple[SingleFile, bool]]]) -> Iterator[
+            Tuple[SingleFile, Optional[Tuple[List[OutputVarClassification], FileMetrics]]]]:
+        """
+        This function processes files as they are discovered and yields their classifications and metrics in order.  If
+        more than one worker was requested, each file is sent to a process pool as soon as it is discovered, but results
+        still come back in the same order as a serial run.  Files with fresh cached results are passed through in order
+        without being processed.
+        :param discovered: An iterable of (unprocessed SingleFile instance, True if the cached results are fresh) pairs,
+                           which may also yield None while it is waiting for more files, so that finished results are
+                           passed on in the meantime
+        :return: An iterator over (file, classification list and metrics) pairs, with None for cached files
+        """
+        if self.num_workers > 1:
+            with Pool(self.num_workers) as pool:
+                in_flight: Deque[Tuple[SingleFile, Optional[AsyncResult]]] = deque()
+                for item in discovered:
+                    if item is not None:
+                        f, cached = item
+                        in_flight.append((f, None if cached else pool.apply_async(_process_in_worker, (f,))))
+                    while in_flight and (in_flight[0][1] is None or in_flight[0][1].ready()):
+                        f, result = in_flight.popleft()
+                        yield f, result.get() if result else None
+                while in_flight:
+                    f, result = in_flight.popleft()
+                    yield f, result.get() if result else None
+        else:
+            for item in discovered:
+                if item is not None:
+                    f, cached = item
+                    yield f, None if cached else _process_in_worker(f)
+
+    def _consume_files(self, discovered: Iterable[Optional[Tuple[SingleFile, bool]]],
+                       num_files: Callable[[], int]) -> Iterator[SingleFile]:
+        """
+        This function processes discovered files, merges each one into the running aggregate and the result cache, and
+        notifies the observers.  The cache is saved at the end.
+        :param discovered: An iterable of discovered files, as taken by _process_files()
+        :param num_files: A function returning the current estimate of the total number of files, for the observers
+        :return: An iterator over processed SingleFile instances, in the order they were discovered
+        """
+        results = self._process_files(discovered)
+        try:
+            for i, (f, output) in enumerate(results):
+                if output is None:
+                    f.output_variable_data = self.cache.lookup(f)
+                    f.metrics = FileMetrics(f.idf_base_name, from_cache=True)
+                    f.metrics.num_vars = len(f.output_variable_data)
+                else:
+                    f.output_variable_data, f.metrics = output
+                    if self.cache:
+                        self.cache.store(f)
+                self._merge_file_results(f)
+                self.processed_dirs.append(f.idf_base_name)
+                for observer in self.observers:
+                    observer.file_processed(f.metrics, i + 1, num_files())
+                yield f
+        finally:
+            results.close()
+            if self.cache:
+                print("Reused cached results for %i/%i files" % (self.cache.hits, self.cache.hits + self.cache.misses))
+                try:
+                    self.cache.save()
+                finally:
+                    self.cache.close()
+
+    def iter_files(self) -> Iterator[SingleFile]:
+        """
+        This function lazily processes every applicable file in the build directory.  Files are processed while the
+        discovery is still walking the rest of the build directory.  Each file's classifications are merged into the
+        running aggregate before the file is yielded, and the mapper does not keep any reference to the file, so the
+        per-file data is released as soon as the caller is done with it.  If a result cache is in use, files with
+        unchanged inputs take their results from the cache instead of being processed.  Observers are notified of each
+        file's metrics, and of the discovery and processing stage timings.
+        :return: An iterator over processed SingleFile instances, in a consistent order
+        """
+        t_start = perf_counter()
+        discovery = self._discover_files()
+        try:
+            yield from self._consume_files(discovery, lambda: discovery.num_files)
+        finally:
+            discovery.close()
+            self._stage_finished('discovery', discovery.elapsed)
+            self._stage_finished('processing', perf_counter() - t_start)
+
+    def follow_files(self, poll_interval: float = 2.0, settle_time: float = 5.0, stop_file: Optional[Path] = None,
+                     idle_timeout: Optional[float] = None) -> Iterator[SingleFile]:
+        """
+        This function is the follow mode version of iter_files(), for running while the integration tests are still
+        producing test directories.  The testfiles directory is polled, and each test directory is processed once, as
+        soon as its input files have settled, and merged into the running aggregate.  Once the tests are finished, the
+        remaining directories are processed right away without waiting for them to settle, so the final maps can be
+        written within a poll interval of the last test finishing.  Files come out in the order they became ready.
+        :param poll_interval: Number of seconds to wait between polls
+        :param settle_time: Number of seconds the input files of a test directory must be unchanged before processing it
+        :param stop_file: Optional path to a file whose existence means the tests are finished, such as a file touched
+                          right after the ctest command whether or not the tests passed, which must not exist yet
+        :param idle_timeout: Optional number of seconds without any change in the testfiles directory after which the
+                             tests are taken to be finished
+        :return: An iterator over processed SingleFile instances
+        """
+        if stop_file is None and idle_timeout is None:
+            raise ValueError("Follow mode needs a stop file or an idle timeout to know when the tests are finished")
+        if self.shard is not None:
+            raise ValueError("Follow mode can't be sharded, since the full list of test directories is not known yet")
+        t_start = perf_counter()
+        watcher = TestDirWatcher(
+            self.build_dir / 'testfiles', test_dirs=self.test_dirs, rules_file=self.rules_file, cache=self.cache,
+            settle_time=settle_time, composite_keys=self.composite_keys
+        )
+
+        def discovered() -> Iterator[Optional[Tuple[SingleFile, bool]]]:
+            while True:
+                # check for the end before polling, so the final poll sees everything the tests wrote
+                finished = (stop_file is not None and stop_file.exists()) or (
+                    idle_timeout is not None and watcher.idle_time() >= idle_timeout
+                )
+                yield from watcher.poll(final=finished)
+                if finished:
+                    return
+                yield None
+                sleep(poll_interval)
+
+        try:
+            yield from self._consume_files(discovered(), lambda: watcher.num_files)
+        finally:
+            self._stage_finished('discovery', watcher.elapsed)
+            self._stage_finished('processing', perf_counter() - t_start)
+
+    def follow(self, **follow_options) -> None:
+        """
+        Runs the follow mode to completion and then builds the final mappings, ready to dump.
+        :param follow_options: Keyword arguments for follow_files(), such as stop_file or idle_timeout
+        :return: Nothing
+        """
+        for _ in self.follow_files(**follow_options):
+            pass
+        self.finalize()
+
+    def _merge_file_results(self, f: SingleFile) -> None:
+        """
+        This function merges the classifications of a single file into the running aggregate of all unique object
+        types for each output variable, and into the provenance if it is tracked.
+        :param f: A processed SingleFile instance
+        :return: Nothing
+        """
+        for output in f.output_variable_data:
+            self._merge_classification(output)
+        if self.provenance:
+            file_id = self.provenance.add_file(f.idf_base_name)
+            for output in f.output_variable_data:
+                self.provenance.add(file_id, output.output_variable_name, output.possible_input_objects)
+
+    def _merge_classification(self, output: OutputVarClassification) -> None:
+        """
+        This function merges a single classification into the running aggregate.
+        :param output: An output variable classification
+        :return: Nothing
+        """
+        found_types = self.output_variable_objects.get(output.output_variable_name)
+        if found_types is None:
+            self.output_variable_objects[output.output_variable_name] = set(output.possible_input_objects)
+        else:
+            found_types.update(output.possible_input_objects)
 
     def _down_select_object_types(self) -> List[OutputVarClassification]:
         """
-        This function takes the huge list of all output variable to input object mappings for all files and creates a
-        new list that finds all unique matches for each output variable.  This is presumably the master list of
-        output variable to input object mappings.
+        This function takes the running aggregate of all unique matches for each output variable across all files and
+        converts it into a list of classifications, sorted by output variable name.  This is presumably the master list
+        of output variable to input object mappings.
         :return: A list of output variable classifications with all file data collapsed into a single list.
         """
-        output_variable_objects: Dict[str, Set[str]] = dict()
-        for input_file in self.all_files:  # loop over all input files to try to collect all info
-            for output in input_file.output_variable_data:  # loop over all output variables to find type matches
-                if output.output_variable_name not in output_variable_objects:
-                    output_variable_objects[output.output_variable_name] = set()
-                for this_possible_input_object in output.possible_input_objects:
-                    output_variable_objects[output.output_variable_name].add(this_possible_input_object)
         all_output_vars: List[OutputVarClassification] = list()
-        for var_name, objects in output_variable_objects.items():
+        for var_name, objects in sorted(self.output_variable_objects.items()):
             all_output_vars.append(OutputVarClassification(var_name, objects))
         return all_output_vars
 
@@ -93,15 +400,18 @@ class OutputVariableMapper:
         """
         This function takes the completed mapping of output variable to input objects and inverts it so that it returns
         a list of input objects with all the identified output variables for that input object.  This is likely the form
-        most interfaces would want to see.
+        most interfaces would want to see.  Object types are visited in sorted order so the result does not depend on
+        set iteration order, which can differ between the parent and worker processes.
         :return: A plain Python dict where keys are string input objects and values are lists of output variable names.
         """
-        object_to_ov_map = dict()
+        object_to_ov_map: Dict[str, List[str]] = dict()
+        found_vars: Dict[str, Set[str]] = dict()
         for ov in self.final_mapping:
-            for obj_type in ov.possible_input_objects:
+            for obj_type in sorted(ov.possible_input_objects):
                 if obj_type not in object_to_ov_map:
                     object_to_ov_map[obj_type] = [ov.output_variable_name]
-                else:
-                    if ov not in object_to_ov_map[obj_type]:
-                        object_to_ov_map[obj_type].append(ov.output_variable_name)
+                    found_vars[obj_type] = {ov.output_variable_name}
+                elif ov.output_variable_name not in found_vars[obj_type]:
+                    object_to_ov_map[obj_type].append(ov.output_variable_name)
+                    found_vars[obj_type].add(ov.output_variable_name)
         return object_to_ov_map
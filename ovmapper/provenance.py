@@ -0,0 +1,201 @@
+from json import dumps, loads
+from pathlib import Path
+from sys import intern
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class FileBitset:
+    """
+    This class is a set of file ids stored as one bit per file in a byte array, where bit i (the (i % 8)-th lowest bit
+    of byte i // 8) is set if file id i is in the set.  With about a thousand test files this is about 125 bytes per
+    set, no matter how many files are in it, instead of a Python set with an entry for each file.
+    """
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits: Optional[bytearray] = None):
+        """
+        This constructor creates a bitset, empty unless existing bits are given.
+        :param bits: Optional byte array holding the bits
+        """
+        self.bits = bits if bits is not None else bytearray()
+
+    def add(self, file_id: int) -> None:
+        """
+        Adds a file id to the set, growing the byte array if needed.
+        :param file_id: The file id to add
+        :return: Nothing
+        """
+        byte_index = file_id >> 3
+        if byte_index >= len(self.bits):
+            self.bits.extend(bytes(byte_index + 1 - len(self.bits)))
+        self.bits[byte_index] |= 1 << (file_id & 7)
+
+    def __contains__(self, file_id: int) -> bool:
+        """
+        Checks whether a file id is in the set.
+        :param file_id: The file id to check
+        :return: True if the file id is in the set
+        """
+        byte_index = file_id >> 3
+        return byte_index < len(self.bits) and bool(self.bits[byte_index] & (1 << (file_id & 7)))
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        Iterates over the file ids in the set, skipping empty bytes.
+        :return: An iterator over the file ids, in increasing order
+        """
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (byte_index << 3) | bit
+
+    def __len__(self) -> int:
+        """
+        Counts the file ids in the set.
+        :return: The number of file ids in the set
+        """
+        return sum(bin(byte).count('1') for byte in self.bits if byte)
+
+    def to_hex(self) -> str:
+        """
+        Converts the bits to a hex string for JSON serialization, without trailing empty bytes.
+        :return: The hex string of the byte array
+        """
+        return bytes(self.bits).rstrip(b'\x00').hex()
+
+    @classmethod
+    def from_hex(cls, hex_bits: str) -> 'FileBitset':
+        """
+        Creates a bitset from a hex string written by to_hex().
+        :param hex_bits: The hex string of the byte array
+        :return: A new FileBitset instance
+        """
+        return cls(bytearray.fromhex(hex_bits))
+
+
+class Provenance:
+    """
+    This class keeps track of which test directories produced each (output variable, object type) pair, so that a bad
+    association can be traced back to the input files that introduced it without re-running anything.  Test directories
+    are numbered in a file id table, and each pair holds a FileBitset over those ids.
+    """
+
+    # Bump this whenever the provenance file layout changes
+    version = 1
+
+    def __init__(self):
+        """
+        This constructor creates an empty provenance record.
+        """
+        self.test_dirs: List[str] = list()
+        self.file_ids: Dict[str, int] = dict()
+        self.pairs: Dict[str, Dict[str, FileBitset]] = dict()
+
+    def add_file(self, test_dir: str) -> int:
+        """
+        Adds a test directory to the file id table, if it is not in there yet.
+        :param test_dir: Name of the test directory
+        :return: The file id of the test directory
+        """
+        file_id = self.file_ids.get(test_dir)
+        if file_id is None:
+            file_id = self.file_ids[test_dir] = len(self.test_dirs)
+            self.test_dirs.append(test_dir)
+        return file_id
+
+    def add(self, file_id: int, var_name: str, object_types: Iterable[str]) -> None:
+        """
+        Records that a file produced an output variable for each of a set of object types.
+        :param file_id: The file id returned by add_file()
+        :param var_name: The output variable name
+        :param object_types: The object types the output variable was matched to in this file
+        :return: Nothing
+        """
+        var_pairs = self.pairs.get(var_name)
+        if var_pairs is None:
+            var_pairs = self.pairs[var_name] = dict()
+        # this runs for every pair of every file, so FileBitset.add() is inlined here
+        byte_index = file_id >> 3
+        mask = 1 << (file_id & 7)
+        for object_type in object_types:
+            bitset = var_pairs.get(object_type)
+            if bitset is None:
+                bitset = var_pairs[object_type] = FileBitset()
+            bits = bitset.bits
+            if byte_index >= len(bits):
+                bits.extend(bytes(byte_index + 1 - len(bits)))
+            bits[byte_index] |= mask
+
+    def test_dirs_for(self, var_name: str, object_type: str) -> List[str]:
+        """
+        Looks up the test directories that produced an (output variable, object type) pair.
+        :param var_name: The output variable name, as it appears in the mapping: ZONE AIR TEMPERATURE
+        :param object_type: The object type, as it appears in the mapping: ZONE
+        :return: The sorted list of test directory names, which is empty if the pair was never produced
+        """
+        bitset = self.pairs.get(var_name, {}).get(object_type)
+        if bitset is None:
+            return []
+        return sorted(self.test_dirs[i] for i in bitset)
+
+    def to_object(self) -> dict:
+        """
+        Converts this object instance into a dict() for JSON serialization, with each bitset as a hex string.
+        :return: A dict with the file id table and the bitset of every pair, sorted by output variable and object type
+        """
+        return {
+            'version': self.version,
+            'test_dirs': self.test_dirs,
+            'OutputVariables': {
+                var_name: {object_type: var_pairs[object_type].to_hex() for object_type in sorted(var_pairs)}
+                for var_name, var_pairs in sorted(self.pairs.items())
+            },
+        }
+
+    def merge_object(self, json_data: dict) -> None:
+        """
+        Merges provenance written by to_object() into this one, renumbering its file ids into this file id table.
+        :param json_data: A dict from to_object()
+        :return: Nothing
+        """
+        if json_data.get('version') != self.version:
+            raise ValueError("Unsupported provenance version %s" % json_data.get('version'))
+        id_map = [self.add_file(test_dir) for test_dir in json_data['test_dirs']]
+        for var_name, var_pairs in json_data['OutputVariables'].items():
+            var_name = intern(var_name)
+            for object_type, hex_bits in var_pairs.items():
+                object_types = (intern(object_type),)
+                for file_id in FileBitset.from_hex(hex_bits):
+                    self.add(id_map[file_id], var_name, object_types)
+
+    def dump(self, provenance_path: Path) -> None:
+        """
+        Writes the provenance to a JSON file.
+        :param provenance_path: Path of the JSON file to write
+        :return: Nothing
+        """
+        with open(str(provenance_path), 'w') as f:
+            f.write(dumps(self.to_object()))
+
+    @classmethod
+    def load(cls, provenance_path: Path) -> 'Provenance':
+        """
+        Reads the provenance from a JSON file written by dump().
+        :param provenance_path: Path of the JSON file to read
+        :return: A new Provenance instance
+        """
+        with open(str(provenance_path)) as f:
+            json_data = loads(f.read())
+        if json_data.get('version') != cls.version:
+            raise ValueError("Unsupported provenance file version in %s" % provenance_path)
+        provenance = cls()
+        for test_dir in json_data['test_dirs']:
+            provenance.add_file(test_dir)
+        provenance.pairs = {
+            intern(var_name): {intern(object_type): FileBitset.from_hex(hex_bits) for object_type, hex_bits in
+                               var_pairs.items()}
+            for var_name, var_pairs in json_data['OutputVariables'].items()
+        }
+        return provenance
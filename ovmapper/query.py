@@ -0,0 +1,225 @@
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from struct import calcsize, pack, unpack_from
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# File layout, all integers are little endian:
+#  header: magic, number of output variables, number of object types, and the byte offsets of the four tables below
+#  output variable string table: uint32 offsets[n + 1] relative to the end of the offsets, then the utf-8 string bytes
+#  object type string table: same layout as the output variable string table
+#  output variable edge table: uint32 starts[n + 1], then uint32 object type ids, grouped by output variable
+#  object type edge table: uint32 starts[n + 1], then uint32 output variable ids, grouped by object type
+# Both string tables are sorted by their utf-8 bytes so names can be found with a binary search, and ids are indexes
+# into the sorted string tables, so each group of ids also comes out in sorted name order.
+MAGIC = b'OVMAPIX1'
+_HEADER = '<8sIIQQQQ'
+_HEADER_SIZE = calcsize(_HEADER)
+
+
+def _string_table(names: List[bytes]) -> bytes:
+    """
+    Packs a sorted list of strings into a string table.
+    :param names: Sorted list of utf-8 encoded names
+    :return: The packed bytes of the table
+    """
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    return pack('<%iI' % len(offsets), *offsets) + b''.join(names)
+
+
+def _edge_table(groups: List[List[int]]) -> bytes:
+    """
+    Packs a list of id groups into an edge table.
+    :param groups: A list with one list of target ids for each source id
+    :return: The packed bytes of the table
+    """
+    starts = [0]
+    for group in groups:
+        starts.append(starts[-1] + len(group))
+    ids = [i for group in groups for i in group]
+    return pack('<%iI' % len(starts), *starts) + pack('<%iI' % len(ids), *ids)
+
+
+def write_index(index_path: Path, output_var_to_objects: Dict[str, Iterable[str]]) -> None:
+    """
+    Writes the binary lookup index for the output variable to object type mapping, in both directions.
+    :param index_path: Path of the index file to write
+    :param output_var_to_objects: A dict of {output variable name => object type names}
+    :return: Nothing
+    """
+    var_names = sorted(name.encode('utf-8') for name in output_var_to_objects)
+    object_names = sorted({t.encode('utf-8') for types in output_var_to_objects.values() for t in types})
+    object_ids = {name.decode('utf-8'): i for i, name in enumerate(object_names)}
+    var_to_objects: List[List[int]] = list()
+    object_to_vars: List[List[int]] = [list() for _ in object_names]
+    for var_id, var_name in enumerate(var_names):
+        ids = sorted({object_ids[t] for t in output_var_to_objects[var_name.decode('utf-8')]})
+        var_to_objects.append(ids)
+        for object_id in ids:
+            object_to_vars[object_id].append(var_id)
+    tables = [_string_table(var_names), _string_table(object_names), _edge_table(var_to_objects),
+              _edge_table(object_to_vars)]
+    table_offsets = list()
+    offset = _HEADER_SIZE
+    for table in tables:
+        table_offsets.append(offset)
+        offset += len(table)
+    with open(str(index_path), 'wb') as f:
+        f.write(pack(_HEADER, MAGIC, len(var_names), len(object_names), *table_offsets))
+        for table in tables:
+            f.write(table)
+
+
+class MappingIndex:
+    """
+    This class answers output variable and object type lookups from a binary index written by write_index().  The file
+    is only memory mapped when the first lookup happens, and each lookup is a binary search that only touches the few
+    strings and ids it needs, so nothing is parsed up front.
+    """
+
+    def __init__(self, index_path: Path):
+        """
+        This constructor just stores the index path, the file is opened lazily.
+        :param index_path: Path to a binary index file
+        """
+        self.index_path = index_path
+        self._file = None
+        self._data: Optional[mmap] = None
+        self.num_output_variables = 0
+        self.num_object_types = 0
+        self._table_offsets = (0, 0, 0, 0)
+
+    def __enter__(self) -> 'MappingIndex':
+        """
+        Allows the index to be used as a context manager that closes the file at the end.
+        :return: This instance
+        """
+        return self
+
+    def __exit__(self, *args) -> None:
+        """
+        Closes the file at the end of a with block.
+        :return: Nothing
+        """
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the memory mapped file, if it was opened.
+        :return: Nothing
+        """
+        if self._data is not None:
+            self._data.close()
+            self._file.close()
+            self._data = None
+            self._file = None
+
+    def _open(self) -> mmap:
+        """
+        Opens and memory maps the index file if needed, reading only the header.
+        :return: The memory mapped index data
+        """
+        if self._data is None:
+            self._file = open(str(self.index_path), 'rb')
+            self._data = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+            magic, self.num_output_variables, self.num_object_types, *offsets = unpack_from(_HEADER, self._data)
+            if magic != MAGIC:
+                self.close()
+                raise ValueError("Not an output variable mapping index: " + str(self.index_path))
+            self._table_offsets = tuple(offsets)
+        return self._data
+
+    def _string(self, table: int, count: int, i: int) -> bytes:
+        """
+        Reads a single string from a string table.
+        :param table: Byte offset of the string table
+        :param count: Number of strings in the table
+        :param i: Index of the string to read
+        :return: The raw utf-8 bytes of the string
+        """
+        start, end = unpack_from('<2I', self._data, table + 4 * i)
+        blob = table + 4 * (count + 1)
+        return self._data[blob + start:blob + end]
+
+    def _find(self, table: int, count: int, name: str) -> int:
+        """
+        Finds a string in a sorted string table with a binary search.
+        :param table: Byte offset of the string table
+        :param count: Number of strings in the table
+        :param name: The string to find
+        :return: The index of the string, or -1 if it is not in the table
+        """
+        target = name.encode('utf-8')
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(table, count, mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < count and self._string(table, count, lo) == target:
+            return lo
+        return -1
+
+    def _lookup(self, name: str, source_table: int, source_count: int, edge_table: int, target_table: int,
+                target_count: int) -> List[str]:
+        """
+        Finds a name in one string table and returns all names it is linked to in the other string table.
+        :param name: The name to look up
+        :param source_table: Byte offset of the string table holding the name
+        :param source_count: Number of strings in the source string table
+        :param edge_table: Byte offset of the edge table going from the source to the target string table
+        :param target_table: Byte offset of the string table holding the linked names
+        :param target_count: Number of strings in the target string table
+        :return: The sorted list of linked names, which is empty if the name is not in the index
+        """
+        self._open()
+        i = self._find(source_table, source_count, name)
+        if i < 0:
+            return []
+        start, end = unpack_from('<2I', self._data, edge_table + 4 * i)
+        ids = unpack_from('<%iI' % (end - start), self._data, edge_table + 4 * (source_count + 1 + start))
+        return [self._string(target_table, target_count, j).decode('utf-8') for j in ids]
+
+    def object_types_for(self, output_variable: str) -> List[str]:
+        """
+        Looks up the object types that have a given output variable.
+        :param output_variable: The output variable name, as it appears in the mapping: ZONE AIR TEMPERATURE
+        :return: The sorted list of object types, which is empty if the output variable is not in the index
+        """
+        self._open()
+        var_table, object_table, var_edges, _ = self._table_offsets
+        return self._lookup(
+            output_variable, var_table, self.num_output_variables, var_edges, object_table, self.num_object_types
+        )
+
+    def output_variables_for(self, object_type: str) -> List[str]:
+        """
+        Looks up the output variables available for a given object type.
+        :param object_type: The object type, as it appears in the mapping: ZONE
+        :return: The sorted list of output variable names, which is empty if the object type is not in the index
+        """
+        self._open()
+        var_table, object_table, _, object_edges = self._table_offsets
+        return self._lookup(
+            object_type, object_table, self.num_object_types, object_edges, var_table, self.num_output_variables
+        )
+
+    def output_variables(self) -> Iterator[str]:
+        """
+        Iterates over all output variable names in the index, in sorted order.
+        :return: An iterator over output variable names
+        """
+        self._open()
+        for i in range(self.num_output_variables):
+            yield self._string(self._table_offsets[0], self.num_output_variables, i).decode('utf-8')
+
+    def object_types(self) -> Iterator[str]:
+        """
+        Iterates over all object types in the index, in sorted order.
+        :return: An iterator over object type names
+        """
+        self._open()
+        for i in range(self.num_object_types):
+            yield self._string(self._table_offsets[1], self.num_object_types, i).decode('utf-8')
@@ -0,0 +1,114 @@
+from hashlib import sha1
+from json import loads
+from pathlib import Path
+from re import compile, escape
+from sys import intern
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_RULES_FILE = Path(__file__).parent / 'rules.json'
+
+
+class RuleSet:
+    """
+    This class holds the compiled form of the rule table of known gotchas, which is loaded from a JSON data file so that
+    new gotchas can be added without changing code.  There are two kinds of rules in the table:
+     - special_cases: every matching rule applies, and if any of them add object types, the variable is fully handled
+     - instance_name_gotchas: only the first matching rule applies, and it replaces the instance name matching
+    There are also the composite_keys settings, which are only used when composite key matching is turned on.
+    Rules match on exact output variable keys with a "keys" list, or on the start of the output variable name with a
+    "prefixes" list.  The prefixes are compiled into single regular expressions, and results are memoized by variable
+    name, so classifying a variable is one dict lookup for the key plus one cached match for the name.
+    """
+
+    def __init__(self, rule_data: dict, signature: str = ''):
+        """
+        This constructor compiles the rule table.
+        :param rule_data: The rule table dict, as read from a rules JSON file
+        :param signature: A string identifying the contents of the rule table, used to invalidate cached results
+        """
+        self.signature = signature
+        self._key_types: Dict[str, Tuple[str, ...]] = dict()
+        self._keys_added_as_types = set()
+        special_prefixes: List[Tuple[str, Tuple[str, ...]]] = list()
+        for rule in rule_data.get('special_cases', []):
+            added_types = tuple(intern(t) for t in rule.get('add', []))
+            for key in rule.get('keys', []):
+                self._key_types[key] = self._key_types.get(key, tuple()) + added_types
+                if rule.get('add_key', False):
+                    self._keys_added_as_types.add(key)
+            for prefix in rule.get('prefixes', []):
+                special_prefixes.append((prefix, added_types))
+        # each prefix gets its own optional lookahead group, so a single match reports every prefix that applies
+        self._special_prefix_types = [added_types for _, added_types in special_prefixes]
+        self._special_prefix_pattern = compile(''.join('(?:(?=(%s)))?' % escape(p) for p, _ in special_prefixes))
+        gotcha_prefixes: List[Tuple[str, Tuple[str, ...]]] = list()
+        for rule in rule_data.get('instance_name_gotchas', []):
+            added_types = tuple(intern(t) for t in rule.get('add', []))
+            for prefix in rule.get('prefixes', []):
+                gotcha_prefixes.append((prefix, added_types))
+        # a plain alternation tries the prefixes in table order, so the first matching rule wins
+        self._gotcha_prefix_types = [added_types for _, added_types in gotcha_prefixes]
+        self._gotcha_prefix_pattern = compile('|'.join('(%s)' % escape(p) for p, _ in gotcha_prefixes) or '(?!)')
+        composite_keys = rule_data.get('composite_keys', {})
+        self.composite_min_name_length: int = composite_keys.get('min_name_length', 3)
+        self.composite_context_types = frozenset(intern(t) for t in composite_keys.get('context_types', []))
+        self.composite_joiners: Tuple[str, ...] = tuple(j.upper() for j in composite_keys.get('joiners', []) if j)
+        self._special_cache: Dict[str, Tuple[str, ...]] = dict()
+        self._gotcha_cache: Dict[str, Tuple[str, ...]] = dict()
+
+    @classmethod
+    def from_file(cls, rules_file: Path) -> 'RuleSet':
+        """
+        Reads and compiles a rules JSON file.
+        :param rules_file: Path to the rules JSON file
+        :return: A compiled RuleSet instance
+        """
+        rule_text = rules_file.read_text()
+        return cls(loads(rule_text), sha1(rule_text.encode()).hexdigest())
+
+    def special_case_types(self, var_name: str, var_key: str) -> Tuple[str, ...]:
+        """
+        Finds the object types that all matching special case rules add for an output variable.
+        :param var_name: The name of the output variable: System Node Temperature
+        :param var_key: The key of the output variable: Environment
+        :return: A tuple of object types to add, which is empty if no special case applies
+        """
+        by_name = self._special_cache.get(var_name)
+        if by_name is None:
+            m = self._special_prefix_pattern.match(var_name)
+            by_name = tuple(t for i, p in enumerate(m.groups()) if p is not None for t in self._special_prefix_types[i])
+            self._special_cache[var_name] = by_name
+        by_key = self._key_types.get(var_key)
+        if by_key is None:
+            return by_name
+        if var_key in self._keys_added_as_types:
+            by_key = by_key + (intern(var_key.upper()),)
+        return by_key + by_name
+
+    def instance_name_gotcha_types(self, var_name: str) -> Tuple[str, ...]:
+        """
+        Finds the object types added by the first instance name gotcha rule matching an output variable name.
+        :param var_name: The name of the output variable: Zone Air Drybulb Temperature
+        :return: A tuple of object types to add, which is empty if no rule applies
+        """
+        types = self._gotcha_cache.get(var_name)
+        if types is None:
+            m = self._gotcha_prefix_pattern.match(var_name)
+            types = self._gotcha_prefix_types[m.lastindex - 1] if m else tuple()
+            self._gotcha_cache[var_name] = types
+        return types
+
+
+_loaded_rule_sets: Dict[Path, RuleSet] = dict()
+
+
+def get_rule_set(rules_file: Optional[Path] = None) -> RuleSet:
+    """
+    Gets the compiled rule set for a rules file, compiling it only once per process.
+    :param rules_file: Path to a rules JSON file, or None to use the rules shipped with this package
+    :return: A compiled RuleSet instance
+    """
+    rules_file = rules_file or DEFAULT_RULES_FILE
+    if rules_file not in _loaded_rule_sets:
+        _loaded_rule_sets[rules_file] = RuleSet.from_file(rules_file)
+    return _loaded_rule_sets[rules_file]
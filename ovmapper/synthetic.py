@@ -0,0 +1,141 @@
+from json import dumps
+from pathlib import Path
+from random import Random
+from typing import Dict, List, Optional, Tuple
+
+# A mix of object types, each with the prefix of the output variable names it reports, so that the generated output
+# variables also run through the special case and instance name gotcha rules
+DEFAULT_OBJECT_TYPES: List[Tuple[str, str]] = [
+    ('Zone', 'Zone'),
+    ('BuildingSurface:Detailed', 'Surface'),
+    ('FenestrationSurface:Detailed', 'Surface Window'),
+    ('Lights', 'Lights'),
+    ('People', 'People'),
+    ('ElectricEquipment', 'Electric Equipment'),
+    ('AirLoopHVAC', 'Air System'),
+    ('Coil:Cooling:DX:SingleSpeed', 'Cooling Coil'),
+    ('Coil:Heating:Electric', 'Heating Coil'),
+    ('Fan:VariableVolume', 'Fan'),
+    ('Pump:VariableSpeed', 'Pump'),
+    ('Chiller:Electric:EIR', 'Chiller'),
+    ('Boiler:HotWater', 'Boiler'),
+    ('Schedule:Compact', 'Schedule Value'),
+    ('NodeList', 'System Node'),
+    ('Curve:Quadratic', 'Performance Curve'),
+    ('AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl', 'VRF Heat Pump'),
+    ('ComponentCost:LineItem', 'Component Cost'),
+    ('EnergyManagementSystem:Sensor', 'EMS Sensor'),
+]
+
+# The epJSON file names SingleFile looks for, in terms of the test directory name
+EPJSON_NAMING_CASES = ['{name}.epJSON', 'expanded.epJSON', '{name}-000001.epJSON', '{name}-G000.epJSON']
+
+
+class SyntheticBuildTree:
+    """
+    This class writes a fake build directory with a testfiles directory that looks like the result of running the
+    integration tests on the special output variable branch, so that the mapping pipeline can be exercised and timed
+    without an EnergyPlus build.  Every test directory gets an output_vars.csv file and an epJSON file, and the epJSON
+    naming cycles through all the cases that SingleFile resolves.  A few directories are also left without an epJSON
+    file to exercise the skipping logic.
+    """
+
+    def __init__(self, num_dirs: int = 100, csv_rows: int = 2000, instances_per_type: int = 20,
+                 fields_per_instance: int = 10, vars_per_type: int = 10,
+                 object_types: Optional[List[Tuple[str, str]]] = None, missing_epjson_every: int = 50, seed: int = 1):
+        """
+        This constructor takes the parameters describing the size and shape of the tree.
+        :param num_dirs: Number of test directories to create
+        :param csv_rows: Number of rows in each output_vars.csv file, including repeated variables and EMS rows
+        :param instances_per_type: Average number of instances of each object type in each epJSON file
+        :param fields_per_instance: Number of fields in each instance body, which controls the epJSON file size
+        :param vars_per_type: Number of distinct output variables reported by each object type
+        :param object_types: List of (object type, output variable name prefix) pairs, defaulting to a typical mix
+        :param missing_epjson_every: Every n-th test directory gets no epJSON file, 0 to always write one
+        :param seed: Random seed, so the same parameters always generate the same tree
+        """
+        self.num_dirs = num_dirs
+        self.csv_rows = csv_rows
+        self.instances_per_type = instances_per_type
+        self.fields_per_instance = fields_per_instance
+        self.vars_per_type = vars_per_type
+        self.object_types = object_types or DEFAULT_OBJECT_TYPES
+        self.missing_epjson_every = missing_epjson_every
+        self.seed = seed
+
+    def write(self, build_dir: Path) -> Path:
+        """
+        Writes the synthetic tree.
+        :param build_dir: The fake build directory, the testfiles directory is created inside of it
+        :return: The path to the testfiles directory
+        """
+        random = Random(self.seed)
+        test_file_dir = build_dir / 'testfiles'
+        for i in range(self.num_dirs):
+            name = 'SyntheticFile%05i' % i
+            test_dir = test_file_dir / name
+            test_dir.mkdir(parents=True, exist_ok=True)
+            input_objects = self._input_objects(random)
+            if not self.missing_epjson_every or (i + 1) % self.missing_epjson_every != 0:
+                epjson_name = EPJSON_NAMING_CASES[i % len(EPJSON_NAMING_CASES)].format(name=name)
+                (test_dir / epjson_name).write_text(dumps(input_objects, indent=4))
+            (test_dir / 'output_vars.csv').write_text(self._output_vars_csv(random, input_objects))
+            (test_dir / 'eplusout.end').write_text('EnergyPlus Completed Successfully-- 0 Warning; 0 Severe Errors\n')
+        return test_file_dir
+
+    def _input_objects(self, random: Random) -> Dict[str, Dict[str, dict]]:
+        """
+        Builds the contents of a single epJSON file.
+        :param random: The random number generator for this tree
+        :return: A dict of {object type => {instance name => instance fields}}
+        """
+        input_objects: Dict[str, Dict[str, dict]] = dict()
+        zone_names = ['Zone %i' % i for i in range(max(1, self.instances_per_type))]
+        for obj_type, _ in self.object_types:
+            num_instances = random.randint(
+                max(1, self.instances_per_type // 2), max(1, self.instances_per_type * 3 // 2)
+            )
+            instances: Dict[str, dict] = dict()
+            for j in range(num_instances):
+                fields: Dict[str, object] = {'field_%i' % k: random.random() for k in range(self.fields_per_instance)}
+                fields['zone_name'] = random.choice(zone_names)
+                if obj_type.endswith('Surface:Detailed'):
+                    fields['vertices'] = [
+                        {'vertex_x_coordinate': random.random(), 'vertex_y_coordinate': random.random(),
+                         'vertex_z_coordinate': random.random()} for _ in range(4)
+                    ]
+                if obj_type == 'AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl':
+                    fields['heat_pump_name'] = 'VRF Heat Pump %i' % j
+                if obj_type == 'Zone':
+                    instance_name = zone_names[j % len(zone_names)]
+                else:
+                    # reuse zone names now and then, like the example files that name internal gains after the zone
+                    instance_name = random.choice(zone_names) if random.random() < 0.05 else '%s %i' % (obj_type, j)
+                instances[instance_name] = fields
+            input_objects[obj_type] = instances
+        return input_objects
+
+    def _output_vars_csv(self, random: Random, input_objects: Dict[str, Dict[str, dict]]) -> str:
+        """
+        Builds the contents of a single output_vars.csv file, with one row per output variable and key.
+        :param random: The random number generator for this tree
+        :param input_objects: The contents of the matching epJSON file
+        :return: The csv file contents
+        """
+        keyed_vars: List[Tuple[str, List[str]]] = list()
+        for obj_type, var_prefix in self.object_types:
+            instances = input_objects.get(obj_type, {})
+            if obj_type == 'AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl':
+                keys = [fields['heat_pump_name'] for fields in instances.values()]
+            else:
+                keys = list(instances)
+            for k in range(self.vars_per_type):
+                keyed_vars.append(('%s Synthetic Variable %i' % (var_prefix, k), keys or ['Unknown Key']))
+        keyed_vars.append(('Site Outdoor Air Drybulb Temperature', ['Environment']))
+        keyed_vars.append(('Facility Total Electricity Demand Rate', ['Whole Building']))
+        rows: List[str] = list()
+        while len(rows) < self.csv_rows:
+            var_name, keys = random.choice(keyed_vars)
+            key = 'EMS' if random.random() < 0.02 else random.choice(keys)
+            rows.append('%s,W,Zone,%s' % (var_name, key))
+        return '\n'.join(rows) + '\n'
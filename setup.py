@@ -1,8 +1,11 @@
 import distutils.cmd
+import distutils.errors
 import distutils.log
 from pathlib import Path
 from setuptools import setup
 
+from ovmapper.benchmark import MappingBenchmark
+from ovmapper.metrics import MetricsRecorder, ProgressReporter
 from ovmapper.processor import OutputVariableMapper
 
 
@@ -10,33 +13,180 @@ class Mapper(distutils.cmd.Command):
     """A custom command to run Mapping operations"""
 
     description = 'Run E+ output variable mapping process'
-    user_options = []
+    user_options = [
+        ('build-dir=', 'b', 'Path to the EnergyPlus build directory holding the testfiles directory'),
+        ('workers=', 'j', 'Number of worker processes to use, defaults to 1 for a serial run'),
+        ('cache-file=', None, 'Path to the persistent result cache, defaults to _build/result_cache.jsonl'),
+        ('no-cache', None, 'Process every test directory without reading or writing the result cache'),
+        ('rules-file=', None, 'Path to a JSON rule table of known gotchas, defaults to the one in ovmapper'),
+        ('test-dirs=', None, 'Comma separated list of test directory names to process, defaults to all of them'),
+        ('shard-index=', None, 'Index of the shard of the sorted test directories to process, requires --shard-count'),
+        ('shard-count=', None, 'Total number of shards the sorted test directories are split into'),
+        ('partial-output=', None, 'Write a partial results file here for the reduce command instead of the final maps'),
+        ('metrics-file=', None, 'Write a JSON report of per-file and per-stage timings here'),
+        ('follow', None, 'Process test directories while the tests run, needs --stop-file or --idle-timeout'),
+        ('poll-interval=', None, 'Number of seconds between polls of the testfiles directory in follow mode'),
+        ('settle-time=', None, 'In follow mode, seconds the input files must be unchanged before processing them'),
+        ('stop-file=', None, 'In follow mode, the tests are finished once this file exists'),
+        ('idle-timeout=', None, 'In follow mode, the tests are finished once nothing changed for this many seconds'),
+        ('provenance', None, 'Record which test directories produced each output variable and object type pair'),
+        ('composite-keys', None, 'Also match keys made of several instance names joined together'),
+    ]
+    boolean_options = ['no-cache', 'follow', 'provenance', 'composite-keys']
 
     def initialize_options(self):
-        pass
+        self.build_dir = '/eplus/repos/4eplus/builds/r'
+        self.workers = 1
+        self.cache_file = None
+        self.no_cache = False
+        self.rules_file = None
+        self.test_dirs = None
+        self.shard_index = None
+        self.shard_count = None
+        self.partial_output = None
+        self.metrics_file = None
+        self.follow = False
+        self.poll_interval = 2.0
+        self.settle_time = 5.0
+        self.stop_file = None
+        self.idle_timeout = None
+        self.provenance = False
+        self.composite_keys = False
 
     def finalize_options(self):
-        pass
+        self.workers = int(self.workers)
+        if self.cache_file is None:
+            self.cache_file = str(Path('.') / '_build' / 'result_cache.jsonl')
+        if self.test_dirs is not None:
+            self.test_dirs = [x.strip() for x in self.test_dirs.split(',') if x.strip()]
+        if (self.shard_index is None) != (self.shard_count is None):
+            raise distutils.errors.DistutilsOptionError('--shard-index and --shard-count must be given together')
+        if self.shard_index is not None:
+            self.shard = (int(self.shard_index), int(self.shard_count))
+        else:
+            self.shard = None
+        self.poll_interval = float(self.poll_interval)
+        self.settle_time = float(self.settle_time)
+        if self.idle_timeout is not None:
+            self.idle_timeout = float(self.idle_timeout)
+        if self.follow and self.stop_file is None and self.idle_timeout is None:
+            raise distutils.errors.DistutilsOptionError('--follow needs --stop-file or --idle-timeout')
 
     def run(self):
+        output_path = Path('.') / '_build'
+        output_path.mkdir(exist_ok=True)
+        observers = [ProgressReporter()]
+        recorder = None
+        if self.metrics_file:
+            recorder = MetricsRecorder()
+            observers.append(recorder)
         sch = OutputVariableMapper(
-            Path('/eplus/repos/4eplus/builds/r')  # TODO: Make this path into arg
+            Path(self.build_dir),
+            num_workers=self.workers,
+            cache_file=None if self.no_cache else Path(self.cache_file),
+            rules_file=Path(self.rules_file) if self.rules_file else None,
+            test_dirs=self.test_dirs,
+            shard=self.shard,
+            observers=observers,
+            process=not self.follow,
+            track_provenance=self.provenance,
+            composite_keys=self.composite_keys,
         )
+        if self.follow:
+            sch.follow(
+                poll_interval=self.poll_interval,
+                settle_time=self.settle_time,
+                stop_file=Path(self.stop_file) if self.stop_file else None,
+                idle_timeout=self.idle_timeout,
+            )
+        if self.partial_output:
+            sch.dump_partial_results(Path(self.partial_output))
+        else:
+            sch.dump_results(output_path)
+        if recorder:
+            recorder.write_report(Path(self.metrics_file))
+
+
+class Reducer(distutils.cmd.Command):
+    """A custom command to merge partial results from sharded Mapping operations"""
+
+    description = 'Merge E+ output variable mapping partial result files into the final maps'
+    user_options = [
+        ('partials=', 'p', 'Comma separated list of partial result files written by map --partial-output'),
+        ('provenance', None, 'Merge the provenance of the partial result files, which need map --provenance'),
+    ]
+    boolean_options = ['provenance']
+
+    def initialize_options(self):
+        self.partials = None
+        self.provenance = False
+
+    def finalize_options(self):
+        if not self.partials:
+            raise distutils.errors.DistutilsOptionError('--partials is required')
+        self.partials = [Path(x.strip()) for x in self.partials.split(',') if x.strip()]
+
+    def run(self):
         output_path = Path('.') / '_build'
         output_path.mkdir(exist_ok=True)
+        sch = OutputVariableMapper.from_partial_results(self.partials, track_provenance=self.provenance)
         sch.dump_results(output_path)
 
 
-setup(
-    name='EnergyPlus Output Variable Mapper',
-    version='0.1',
-    packages=['ovmapper'],
-    url='https://github.com/Myoldmopar/EPOutputMapper',
-    license='',
-    author='Edwin Lee',
-    author_email='',
-    description='',
-    cmdclass={
-        'map': Mapper,
-    },
-)
+class Benchmark(distutils.cmd.Command):
+    """A custom command to time each stage of the Mapping operations on synthetic build trees"""
+
+    description = 'Time each stage of the E+ output variable mapping process on synthetic build trees'
+    user_options = [
+        ('scales=', 's', 'Comma separated list of test directory counts to time, defaults to 10,100,1000'),
+        ('csv-rows=', None, 'Number of rows in each synthetic output_vars.csv file'),
+        ('instances-per-type=', None, 'Average number of instances of each object type in each synthetic epJSON file'),
+        ('repeats=', 'r', 'Number of times to time each scale, reporting the fastest'),
+        ('output=', 'o', 'Optional path of a JSON file to write the timings to'),
+        ('compare-matching', None, 'Only time the matching stage, comparing the old nested loop against the index'),
+    ]
+
+    def initialize_options(self):
+        self.scales = '10,100,1000'
+        self.csv_rows = 2000
+        self.instances_per_type = 20
+        self.repeats = 1
+        self.output = None
+        self.compare_matching = False
+
+    def finalize_options(self):
+        self.scales = [int(x) for x in self.scales.split(',') if x.strip()]
+        self.csv_rows = int(self.csv_rows)
+        self.instances_per_type = int(self.instances_per_type)
+        self.repeats = int(self.repeats)
+
+    def run(self):
+        benchmark = MappingBenchmark(
+            self.scales, self.repeats, csv_rows=self.csv_rows, instances_per_type=self.instances_per_type
+        )
+        if self.compare_matching:
+            results = benchmark.compare_matching()
+            MappingBenchmark.report_matching(results, Path(self.output) if self.output else None)
+        else:
+            results = benchmark.run()
+            MappingBenchmark.report(results, Path(self.output) if self.output else None)
+
+
+# the map command starts worker processes, which import this file again under the spawn and forkserver start methods
+if __name__ == '__main__':
+    setup(
+        name='EnergyPlus Output Variable Mapper',
+        version='0.1',
+        packages=['ovmapper'],
+        package_data={'ovmapper': ['rules.json']},
+        url='https://github.com/Myoldmopar/EPOutputMapper',
+        license='',
+        author='Edwin Lee',
+        author_email='',
+        description='',
+        cmdclass={
+            'map': Mapper,
+            'reduce': Reducer,
+            'bench': Benchmark,
+        },
+    )
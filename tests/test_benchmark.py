@@ -0,0 +1,10 @@
+from ovmapper.benchmark import MATCHING_COLUMNS, MappingBenchmark
+
+
+def test_compare_matching_methods_agree():
+    # compare_matching raises if the nested loop and the instance name index give different classifications
+    results = MappingBenchmark([4], instances_per_type=50, csv_rows=300).compare_matching()
+    assert len(results) == 1
+    assert results[0]['num_dirs'] == 4
+    for column in MATCHING_COLUMNS:
+        assert results[0][column] > 0
@@ -0,0 +1,96 @@
+from pathlib import Path
+
+from ovmapper.input_file import SingleFile
+from ovmapper.processor import OutputVariableMapper
+from ovmapper.synthetic import SyntheticBuildTree
+
+
+def mapping_of(mapper: OutputVariableMapper) -> list:
+    """
+    Gathers the final mapping of a mapper in a comparable form.
+    :param mapper: An OutputVariableMapper instance that has processed its files
+    :return: A list of the final mapping objects
+    """
+    return [x.to_object() for x in mapper.final_mapping]
+
+
+def test_cached_results_match_and_are_indexed_per_record(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=12, csv_rows=200).write(build_dir)
+    cache_file = tmp_path / 'cache' / 'result_cache.jsonl'
+    uncached = OutputVariableMapper(build_dir, observers=[])
+    first = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    assert first.cache.hits == 0
+    second = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    assert second.cache.hits == len(second.processed_dirs) > 0
+    assert second.cache.misses == 0
+    assert mapping_of(uncached) == mapping_of(first) == mapping_of(second)
+    # a header line, then one record per processed test directory
+    assert len(cache_file.read_bytes().splitlines()) == 1 + len(second.processed_dirs)
+    # only the fingerprint and file offset of each entry are held in memory
+    assert all(isinstance(offset, int) for _, offset in second.cache.entries.values())
+
+
+def test_entries_outside_of_a_subset_are_kept(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    test_file_dir = SyntheticBuildTree(num_dirs=6, csv_rows=100, missing_epjson_every=0).write(build_dir)
+    cache_file = tmp_path / 'result_cache.jsonl'
+    OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    subset = sorted(x.name for x in test_file_dir.iterdir())[:2]
+    partial = OutputVariableMapper(build_dir, cache_file=cache_file, test_dirs=subset, observers=[])
+    assert partial.cache.hits == 2
+    full = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    assert full.cache.hits == 6
+    assert full.cache.misses == 0
+
+
+def test_changed_inputs_are_processed_again(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    test_file_dir = SyntheticBuildTree(num_dirs=4, csv_rows=100, missing_epjson_every=0).write(build_dir)
+    cache_file = tmp_path / 'result_cache.jsonl'
+    OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    changed_csv = sorted(test_file_dir.glob('*/output_vars.csv'))[0]
+    changed_csv.write_text(changed_csv.read_text() + 'New Variable,C,Zone,NEW KEY\n')
+    rerun = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    assert rerun.cache.hits == 3
+    assert rerun.cache.misses == 1
+    assert 'NEW VARIABLE' in [x.output_variable_name for x in rerun.final_mapping]
+
+
+def test_unreadable_cache_starts_fresh(tmp_path: Path, capsys):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=3, csv_rows=100, missing_epjson_every=0).write(build_dir)
+    cache_file = tmp_path / 'result_cache.jsonl'
+    OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    with open(str(cache_file), 'a') as f:
+        f.write('not json\n')
+    mapper = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[])
+    assert 'Could not read result cache' in capsys.readouterr().out
+    assert mapper.cache.hits == 0
+    assert OutputVariableMapper(build_dir, cache_file=cache_file, observers=[]).cache.hits == 3
+
+
+def test_no_cache_files_are_left_open(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=3, csv_rows=100, missing_epjson_every=0).write(build_dir)
+    cache_file = tmp_path / 'result_cache.jsonl'
+    for _ in range(2):
+        cache = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[]).cache
+        assert cache._old_file is None
+        assert cache._new_file is None
+    assert not cache.temp_path.exists()
+
+
+def test_close_without_save_keeps_the_existing_cache(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    test_file_dir = SyntheticBuildTree(num_dirs=3, csv_rows=100, missing_epjson_every=0).write(build_dir)
+    cache_file = tmp_path / 'result_cache.jsonl'
+    cache = OutputVariableMapper(build_dir, cache_file=cache_file, observers=[]).cache
+    saved = cache_file.read_bytes()
+    f = SingleFile(sorted(test_file_dir.glob('*/output_vars.csv'))[0], process_now=False)
+    assert cache.is_fresh(f)
+    cache.lookup(f)
+    assert cache.temp_path.exists()
+    cache.close()
+    assert not cache.temp_path.exists()
+    assert cache_file.read_bytes() == saved
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from ovmapper.composite import InstanceNameAutomaton
+from ovmapper.processor import OutputVariableMapper
+from ovmapper.synthetic import SyntheticBuildTree
+
+JOINERS = ['INZONE', ' ']
+
+
+def test_find_all_finds_overlapping_names():
+    automaton = InstanceNameAutomaton(['ZONE 1', 'ZONE 18', 'NE 1'])
+    assert sorted(automaton.find_all('ZONE 18')) == [(0, 6, 'ZONE 1'), (0, 7, 'ZONE 18'), (2, 6, 'NE 1')]
+
+
+def test_tiling_names_needs_the_whole_key():
+    automaton = InstanceNameAutomaton(['CASE A', 'ZONE 1', 'PEOPLE'])
+    assert automaton.tiling_names('CASE AINZONEZONE 1', JOINERS) == {'CASE A', 'ZONE 1'}
+    assert automaton.tiling_names('ZONE 1 PEOPLE', JOINERS) == {'ZONE 1', 'PEOPLE'}
+    # a name inside the key is not enough, the rest of the key has to be names and joiners too
+    assert automaton.tiling_names('ZONE 18', JOINERS) == set()
+    assert automaton.tiling_names('ZONE 1 EXTRA', JOINERS) == set()
+    assert automaton.tiling_names('ZONE 1PEOPLE', JOINERS) == set()
+
+
+def test_tiling_names_keeps_every_reading():
+    automaton = InstanceNameAutomaton(['A', 'A B', 'B C', 'C'])
+    assert automaton.tiling_names('A B C', JOINERS) == {'A', 'A B', 'B C', 'C'}
+
+
+def test_composite_keys_do_not_change_synthetic_results(tmp_path: Path):
+    # the synthetic trees have no composite keys, but plenty of keys like ZONE 18 that contain other instance names
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=60).write(build_dir)
+    plain = OutputVariableMapper(build_dir, observers=[])
+    composite = OutputVariableMapper(build_dir, observers=[], composite_keys=True)
+    assert [x.to_object() for x in composite.final_mapping] == [x.to_object() for x in plain.final_mapping]
+    assert composite.inverted_map == plain.inverted_map
@@ -0,0 +1,125 @@
+from os import listdir
+from pathlib import Path
+
+import pytest
+
+from ovmapper.discovery import RUN_FINISHED_MARKER, FileDiscovery, TestDirWatcher
+from ovmapper.input_file import SingleFile
+
+
+def write_running_test_dir(test_file_dir: Path, name: str) -> Path:
+    """
+    Writes a test directory as it looks while its simulation is still running: both input files, but no end marker.
+    :param test_file_dir: The testfiles directory
+    :param name: Name of the test directory
+    :return: The path to the test directory
+    """
+    test_dir = test_file_dir / name
+    test_dir.mkdir(parents=True)
+    (test_dir / (name + '.epJSON')).write_text('{"Zone": {"Zone 1": {}}}')
+    (test_dir / 'output_vars.csv').write_text('Zone Air Temperature,C,Zone,ZONE 1\n')
+    return test_dir
+
+
+def test_settled_dirs_wait_for_the_end_marker(tmp_path: Path):
+    test_file_dir = tmp_path / 'testfiles'
+    test_dir = write_running_test_dir(test_file_dir, 'SlowFile')
+    watcher = TestDirWatcher(test_file_dir, settle_time=0.0)
+    # the input files are not changing, but the simulation has not finished, so more rows could still come
+    for _ in range(3):
+        assert watcher.poll() == []
+    with open(str(test_dir / 'output_vars.csv'), 'a') as f:
+        f.write('Zone Mean Air Temperature,C,Zone,ZONE 1\n')
+    (test_dir / RUN_FINISHED_MARKER).write_text('EnergyPlus Completed Successfully\n')
+    ready = []
+    for _ in range(3):
+        ready.extend(watcher.poll())
+    assert [f.idf_base_name for f, _ in ready] == ['SlowFile']
+    var_names = [x.output_variable_name for x in ready[0][0].process()]
+    assert var_names == ['ZONE AIR TEMPERATURE', 'ZONE MEAN AIR TEMPERATURE']
+    assert watcher.poll(final=True) == []
+
+
+def test_final_poll_hands_out_unfinished_dirs(tmp_path: Path):
+    test_file_dir = tmp_path / 'testfiles'
+    write_running_test_dir(test_file_dir, 'CrashedFile')
+    watcher = TestDirWatcher(test_file_dir, settle_time=0.0)
+    assert watcher.poll() == []
+    assert [f.idf_base_name for f, _ in watcher.poll(final=True)] == ['CrashedFile']
+
+
+def write_test_dirs(test_file_dir: Path, names: list) -> None:
+    """
+    Writes test directories that each have both input files, which is all FileDiscovery looks for.
+    :param test_file_dir: The testfiles directory
+    :param names: Names of the test directories
+    :return: Nothing
+    """
+    for name in names:
+        write_running_test_dir(test_file_dir, name)
+
+
+def discovered_names(discovery: FileDiscovery) -> list:
+    """
+    Runs a discovery to the end.
+    :param discovery: A FileDiscovery instance
+    :return: The test directory names of the discovered files, in the order they came out
+    """
+    return [f.idf_base_name for f, _ in discovery]
+
+
+def test_discovery_is_sorted(tmp_path: Path):
+    test_file_dir = tmp_path / 'testfiles'
+    names = ['File%02i' % i for i in range(20)]
+    write_test_dirs(test_file_dir, list(reversed(names)))
+    assert discovered_names(FileDiscovery(test_file_dir)) == names
+
+
+def test_discovery_filters_test_dirs_and_shards(tmp_path: Path):
+    test_file_dir = tmp_path / 'testfiles'
+    names = ['File%02i' % i for i in range(10)]
+    write_test_dirs(test_file_dir, names)
+    discovery = FileDiscovery(test_file_dir, test_dirs=['File07', 'File02', 'NotThere'])
+    assert discovered_names(discovery) == ['File02', 'File07']
+    assert discovery.num_files == 2
+    shards = [discovered_names(FileDiscovery(test_file_dir, shard=(i, 3))) for i in range(3)]
+    assert shards == [names[0::3], names[1::3], names[2::3]]
+    assert discovered_names(FileDiscovery(test_file_dir, test_dirs=names[:5], shard=(1, 2))) == ['File01', 'File03']
+
+
+def test_discovery_skips_dirs_without_output_vars(tmp_path: Path):
+    test_file_dir = tmp_path / 'testfiles'
+    write_test_dirs(test_file_dir, ['FileA', 'FileB', 'FileC'])
+    (test_file_dir / 'FileB' / 'output_vars.csv').unlink()
+    (test_file_dir / 'NotADir.txt').write_text('')
+    discovery = FileDiscovery(test_file_dir)
+    assert discovered_names(discovery) == ['FileA', 'FileC']
+    assert discovery.num_candidates == 3
+    assert discovery.num_skipped == 1
+    assert discovery.num_files == 2
+
+
+@pytest.mark.parametrize('present', [
+    [0, 1, 2, 3], [1, 2, 3], [2, 3], [3], [1, 3], [0, 2], [],
+])
+def test_epjson_resolution_from_listing_matches_disk(tmp_path: Path, present: list):
+    test_dir = tmp_path / 'testfiles' / 'FileA'
+    test_dir.mkdir(parents=True)
+    (test_dir / 'output_vars.csv').write_text('Zone Air Temperature,C,Zone,ZONE 1\n')
+    candidates = SingleFile.candidate_epjson_names('FileA')
+    for i in present:
+        (test_dir / candidates[i]).write_text('{}')
+    from_disk = SingleFile(test_dir / 'output_vars.csv', process_now=False)
+    from_listing = SingleFile(test_dir / 'output_vars.csv', process_now=False, dir_entries=set(listdir(str(test_dir))))
+    assert from_listing.keep == from_disk.keep == bool(present)
+    if present:
+        assert from_listing.converted_json_file == from_disk.converted_json_file == test_dir / candidates[present[0]]
+        discovered = [f.converted_json_file for f, _ in FileDiscovery(test_dir.parent)]
+        assert discovered == [from_disk.converted_json_file]
+
+
+def test_discovery_errors_reach_the_consumer(tmp_path: Path):
+    discovery = FileDiscovery(tmp_path / 'missing')
+    with pytest.raises(FileNotFoundError):
+        discovered_names(discovery)
+    assert discovery._thread is None
@@ -0,0 +1,135 @@
+from json import dumps, loads
+from pathlib import Path
+
+import pytest
+
+from ovmapper import epjson
+from ovmapper.epjson import _SHALLOW_OBJECT, object_names_from_bytes, object_names_from_json, read_object_names
+from ovmapper.synthetic import SyntheticBuildTree
+
+VRF_TYPE = 'AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl'
+
+
+def reference_object_names(epjson_text: str) -> dict:
+    """
+    The previous way of gathering the object types and instance names: load the whole file with json, and use the
+    heat_pump_name field for the VRF objects that have no name of their own.
+    :param epjson_text: The epJSON contents
+    :return: A dict of {object type => [instance names]}
+    """
+    objects_and_instance_names = dict()
+    for obj_type, instance_dict in loads(epjson_text).items():
+        names = list()
+        for instance_name, instance_fields in instance_dict.items():
+            if obj_type == VRF_TYPE:
+                names.append(instance_fields['heat_pump_name'])
+            else:
+                names.append(instance_name)
+        objects_and_instance_names[obj_type] = names
+    return objects_and_instance_names
+
+
+def assert_same_as_reference(epjson_text: str) -> None:
+    """
+    Checks that the scanner and the json path give exactly the same result as the previous path, including the order
+    of the keys.
+    :param epjson_text: The epJSON contents
+    :return: Nothing
+    """
+    expected = reference_object_names(epjson_text)
+    for actual in [object_names_from_bytes(epjson_text.encode('utf-8')), object_names_from_json(epjson_text)]:
+        assert actual == expected
+        assert list(actual) == list(expected)
+
+
+def test_plain_objects():
+    assert_same_as_reference(dumps({
+        'Zone': {'Zone 1': {'x_origin': 0.0}, 'Zone 2': {}},
+        'Lights': {'Zone 1 Lights': {'zone_or_zonelist_name': 'Zone 1', 'design_level': 100}},
+    }, indent=4))
+
+
+def test_vrf_objects_are_named_by_heat_pump_name():
+    assert_same_as_reference(dumps({
+        VRF_TYPE: {'AirConditioner:VariableRefrigerantFlow:FluidTemperatureControl 1': {'heat_pump_name': 'VRF HP'}},
+        'Zone': {'Zone 1': {}},
+    }))
+
+
+def test_escaped_quotes():
+    assert_same_as_reference(r'{"Zone": {"Zone \"A\"": {"name_note": "a \"quoted\" value \\"}}}')
+
+
+def test_braces_inside_strings():
+    assert_same_as_reference(
+        '{"Schedule:Compact": {"Sched {1}": {"data": [{"field": "Until: 24:00, {}"}, {"field": "}}{{"}]}},'
+        ' "Zone}": {"{Zone": {"note": "{"}}}'
+    )
+
+
+def test_duplicate_type_keys():
+    assert_same_as_reference('{"Zone": {"Zone 1": {}}, "Lights": {"L1": {}}, "Zone": {"Zone 2": {}, "Zone 3": {}}}')
+
+
+def test_duplicate_instance_keys():
+    assert_same_as_reference('{"Zone": {"Zone 1": {"a": 1}, "Zone 2": {}, "Zone 1": {"a": 2}}}')
+
+
+def test_duplicate_vrf_instance_keys_use_last_heat_pump_name():
+    assert_same_as_reference(
+        '{"%s": {"VRF 1": {"heat_pump_name": "First"}, "VRF 1": {"heat_pump_name": "Second"}}}' % VRF_TYPE
+    )
+
+
+def test_unicode_escapes():
+    assert_same_as_reference(
+        '{"Zone": {"Zone \\u00e9t\\u00e9": {"note": "\\ud83d\\ude00"}, "Raum üß": {}, "Tab\\tName": {}}}'
+    )
+
+
+def test_empty_objects():
+    assert_same_as_reference('{}')
+    assert_same_as_reference('{"Zone": {}}')
+    assert_same_as_reference(' { "Zone" : { } , "Lights" : { "L1" : { } } } \n')
+
+
+def test_deep_nesting_uses_the_brace_by_brace_fallback():
+    deep_body = {'level_1': {'level_2': {'level_3': {'level_4': 'a {brace} "quoted" string'}}}, 'after': '}'}
+    # make sure this body is deeper than the single regex fast path can handle
+    assert _SHALLOW_OBJECT.match(dumps(deep_body).encode('utf-8')) is None
+    assert_same_as_reference(dumps({
+        'Zone': {'Zone 1': deep_body, 'Zone 2': {}},
+        VRF_TYPE: {'VRF 1': dict(deep_body, heat_pump_name='VRF HP')},
+    }))
+
+
+def test_invalid_epjson_raises():
+    with pytest.raises(ValueError):
+        object_names_from_bytes(b'{"Zone": {"Zone 1": {}}')
+    with pytest.raises(ValueError):
+        object_names_from_bytes(b'{"Zone": {"Zone 1": {}}} extra')
+
+
+@pytest.mark.parametrize('json_loads_max_bytes', [0, epjson.JSON_LOADS_MAX_BYTES])
+def test_read_object_names_on_synthetic_files(tmp_path: Path, monkeypatch, json_loads_max_bytes: int):
+    # the synthetic files are small, so a limit of zero makes every file go through the scanner
+    monkeypatch.setattr(epjson, 'JSON_LOADS_MAX_BYTES', json_loads_max_bytes)
+    test_file_dir = SyntheticBuildTree(num_dirs=8, missing_epjson_every=0).write(tmp_path / 'build')
+    epjson_paths = sorted(test_file_dir.glob('*/*.epJSON'))
+    assert len(epjson_paths) == 8
+    for epjson_path in epjson_paths:
+        assert read_object_names(epjson_path) == reference_object_names(epjson_path.read_text())
+
+
+def test_names_with_escapes_between_plain_names():
+    assert_same_as_reference(
+        '{"Zone": {"Zone 1": {}, "Zone \\"2\\"": {"a": 1}, "Zone 3": {"b": [{"c": "}"}]}, "Zone\\u0020 4": {}},'
+        ' "Lights": {"L1": {}}}'
+    )
+
+
+def test_read_object_names_rejects_empty_file(tmp_path: Path):
+    epjson_path = tmp_path / 'empty.epJSON'
+    epjson_path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        read_object_names(epjson_path)
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from ovmapper.output_variable import OutputVarLine, read_unique_output_var_lines
+
+
+def reference_output_var_lines(output_var_file: Path) -> list:
+    """
+    The previous way of loading the unique output variables: parse each stripped line with OutputVarLine, skipping blank
+    lines, EMS keys and repeated variable names.
+    :param output_var_file: Path to the output_vars.csv file
+    :return: A list of (name, units, time step, key) tuples, in order of first appearance in the file
+    """
+    var_lines = dict()
+    with open(str(output_var_file)) as f:
+        for line in f.readlines():
+            if line.strip():
+                var = OutputVarLine(line)
+                if var.keep and var.var_name not in var_lines:
+                    var_lines[var.var_name] = (var.var_name, var.units, var.time_step, var.key)
+    return list(var_lines.values())
+
+
+def assert_same_as_reference(tmp_path: Path, csv_bytes: bytes) -> list:
+    """
+    Checks that the bulk reader gives exactly the same variables as the previous line by line path.
+    :param tmp_path: A temporary directory to write the csv file into
+    :param csv_bytes: The output_vars.csv contents
+    :return: The list of (name, units, time step, key) tuples from the bulk reader
+    """
+    output_var_file = tmp_path / 'output_vars.csv'
+    output_var_file.write_bytes(csv_bytes)
+    actual = [(x.var_name, x.units, x.time_step, x.key) for x in read_unique_output_var_lines(output_var_file)]
+    assert actual == reference_output_var_lines(output_var_file)
+    return actual
+
+
+def test_plain_rows(tmp_path: Path):
+    assert_same_as_reference(tmp_path, b'Zone Air Temperature,C,Zone,ZONE 1\nLights Energy,J,Zone,LIGHTS 1\n')
+
+
+def test_trailing_whitespace_on_the_key_is_dropped(tmp_path: Path):
+    actual = assert_same_as_reference(tmp_path, b'A,C,Zone,K1 \nB,C,Zone,EMS \t\nC,C,Zone,K2\t\r\n')
+    assert actual == [('A', 'C', 'Zone', 'K1'), ('C', 'C', 'Zone', 'K2')]
+
+
+def test_whitespace_before_a_fifth_field_is_kept(tmp_path: Path):
+    actual = assert_same_as_reference(tmp_path, b'A,C,Zone,K1 ,extra\nB,C,Zone,EMS ,extra \n')
+    assert actual == [('A', 'C', 'Zone', 'K1 '), ('B', 'C', 'Zone', 'EMS ')]
+
+
+def test_leading_whitespace_and_blank_lines(tmp_path: Path):
+    assert_same_as_reference(tmp_path, b'\n  \t A,C,Zone,K1\n \n\r\nB,C,Zone,K2 \nA,C,Zone,K3')
+
+
+def test_crlf_line_endings(tmp_path: Path):
+    assert_same_as_reference(tmp_path, b'A,C,Zone,K1\r\nB,C,Zone,\r\nC,,,EMS\r\nD,C,Zone,K4')
+
+
+def test_malformed_rows_are_reported_and_skipped(tmp_path: Path, capsys):
+    output_var_file = tmp_path / 'output_vars.csv'
+    output_var_file.write_bytes(b'A,C,Zone,K1\nnot,enough,fields\nB,C,Zone,K2\n')
+    actual = [(x.var_name, x.key) for x in read_unique_output_var_lines(output_var_file)]
+    assert actual == [('A', 'K1'), ('B', 'K2')]
+    assert capsys.readouterr().out.splitlines() == [
+        'Could not process output var CSV line: "not,enough,fields"',
+        'Reason: expected at least four comma separated fields: name, units, time step, key',
+    ]
+
+
+def test_empty_file(tmp_path: Path):
+    assert assert_same_as_reference(tmp_path, b'') == []
@@ -0,0 +1,113 @@
+import sys
+from json import dumps, loads
+from pathlib import Path
+from subprocess import run
+
+import pytest
+
+from ovmapper.processor import OutputVariableMapper
+from ovmapper.synthetic import SyntheticBuildTree
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def dumped_files(output_dir: Path) -> dict:
+    """
+    Reads every file the mapper dumped.
+    :param output_dir: The directory the results were dumped into
+    :return: A dict of {file name => file contents as bytes}
+    """
+    return {x.name: x.read_bytes() for x in sorted(output_dir.iterdir())}
+
+
+def test_parallel_run_matches_serial_run(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=30, csv_rows=300).write(build_dir)
+    (tmp_path / 'serial').mkdir()
+    (tmp_path / 'parallel').mkdir()
+    OutputVariableMapper(build_dir, num_workers=1, observers=[]).dump_results(tmp_path / 'serial')
+    OutputVariableMapper(build_dir, num_workers=2, observers=[]).dump_results(tmp_path / 'parallel')
+    serial = dumped_files(tmp_path / 'serial')
+    assert len(serial) == 3
+    assert dumped_files(tmp_path / 'parallel') == serial
+
+
+def test_map_command_with_spawned_workers(tmp_path: Path):
+    # spawned workers import the main module again, which must not run the setup() call a second time
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=6, csv_rows=100).write(build_dir)
+    script = (
+        "import multiprocessing, runpy, sys\n"
+        "sys.path.insert(0, %r)\n"
+        "multiprocessing.set_start_method('spawn')\n"
+        "sys.argv = ['setup.py', 'map', '-b', %r, '-j', '2', '--no-cache']\n"
+        "runpy.run_path(%r, run_name='__main__')\n"
+    ) % (str(REPO_DIR), str(build_dir), str(REPO_DIR / 'setup.py'))
+    result = run([sys.executable, '-c', script], cwd=str(tmp_path), capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.count('running map') == 1
+    (tmp_path / 'serial').mkdir()
+    OutputVariableMapper(build_dir, observers=[]).dump_results(tmp_path / 'serial')
+    assert dumped_files(tmp_path / '_build') == dumped_files(tmp_path / 'serial')
+
+
+def write_shard_partials(build_dir: Path, output_dir: Path, shard_count: int) -> list:
+    """
+    Maps each shard of a build tree and dumps its partial results.
+    :param build_dir: The build directory holding a testfiles directory
+    :param output_dir: The directory to write the partial result files into
+    :param shard_count: The number of shards
+    :return: The list of partial result file paths, in shard order
+    """
+    partial_paths = list()
+    for shard_index in range(shard_count):
+        partial_path = output_dir / ('partial_%i.json' % shard_index)
+        mapper = OutputVariableMapper(build_dir, shard=(shard_index, shard_count), observers=[])
+        mapper.dump_partial_results(partial_path)
+        partial_paths.append(partial_path)
+    return partial_paths
+
+
+def test_reduced_shards_match_a_single_run(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=20, csv_rows=300).write(build_dir)
+    (tmp_path / 'single').mkdir()
+    (tmp_path / 'reduced').mkdir()
+    single = OutputVariableMapper(build_dir, observers=[])
+    single.dump_results(tmp_path / 'single')
+    partial_paths = write_shard_partials(build_dir, tmp_path, 3)
+    reduced = OutputVariableMapper.from_partial_results(partial_paths)
+    reduced.dump_results(tmp_path / 'reduced')
+    assert dumped_files(tmp_path / 'reduced') == dumped_files(tmp_path / 'single')
+    assert sorted(reduced.processed_dirs) == sorted(single.processed_dirs)
+
+
+def test_partial_results_version_mismatch_raises(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=3, csv_rows=100).write(build_dir)
+    partial_path = write_shard_partials(build_dir, tmp_path, 1)[0]
+    json_data = loads(partial_path.read_text())
+    json_data['version'] = OutputVariableMapper.partial_results_version + 1
+    partial_path.write_text(dumps(json_data))
+    with pytest.raises(ValueError):
+        OutputVariableMapper.from_partial_results([partial_path])
+
+
+def test_duplicate_test_dirs_are_reported_once(tmp_path: Path, capsys):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=4, csv_rows=100, missing_epjson_every=0).write(build_dir)
+    (tmp_path / 'single').mkdir()
+    (tmp_path / 'reduced').mkdir()
+    OutputVariableMapper(build_dir, observers=[]).dump_results(tmp_path / 'single')
+    partial_paths = write_shard_partials(build_dir, tmp_path, 2)
+    capsys.readouterr()
+    # the first shard is merged twice, which must not change the maps or list its test dirs twice
+    reduced = OutputVariableMapper.from_partial_results(partial_paths + partial_paths[:1])
+    out = capsys.readouterr().out
+    first_shard_dirs = loads(partial_paths[0].read_text())['test_dirs']
+    assert len(first_shard_dirs) == 2
+    for test_dir in first_shard_dirs:
+        assert out.count('Test dir "%s" appears in more than one partial results file' % test_dir) == 1
+    assert len(reduced.processed_dirs) == len(set(reduced.processed_dirs)) == 4
+    reduced.dump_results(tmp_path / 'reduced')
+    assert dumped_files(tmp_path / 'reduced') == dumped_files(tmp_path / 'single')
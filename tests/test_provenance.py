@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import pytest
+
+from ovmapper.processor import OutputVariableMapper
+from ovmapper.provenance import FileBitset, Provenance
+from ovmapper.synthetic import SyntheticBuildTree
+
+
+def provenance_pairs(provenance: Provenance) -> list:
+    """
+    Lists every output variable and object type pair that has provenance recorded.
+    :param provenance: A Provenance instance
+    :return: A sorted list of (output variable name, object type) tuples
+    """
+    return sorted(
+        (var_name, object_type) for var_name, var_pairs in provenance.pairs.items() for object_type in var_pairs
+    )
+
+
+def test_bitset_round_trip_across_byte_boundaries():
+    file_ids = [0, 7, 8, 1000]
+    bitset = FileBitset()
+    for file_id in file_ids:
+        bitset.add(file_id)
+    assert list(bitset) == file_ids
+    assert len(bitset) == 4
+    for file_id in range(1010):
+        assert (file_id in bitset) == (file_id in file_ids)
+    assert 5000 not in bitset
+    restored = FileBitset.from_hex(bitset.to_hex())
+    assert list(restored) == file_ids
+    assert FileBitset.from_hex(FileBitset().to_hex()).bits == bytearray()
+
+
+def test_add_and_test_dirs_for():
+    provenance = Provenance()
+    file_b = provenance.add_file('FileB')
+    file_a = provenance.add_file('FileA')
+    assert provenance.add_file('FileB') == file_b
+    provenance.add(file_b, 'ZONE AIR TEMPERATURE', ['ZONE'])
+    provenance.add(file_a, 'ZONE AIR TEMPERATURE', ['ZONE', 'ZONELIST'])
+    assert provenance.test_dirs_for('ZONE AIR TEMPERATURE', 'ZONE') == ['FileA', 'FileB']
+    assert provenance.test_dirs_for('ZONE AIR TEMPERATURE', 'ZONELIST') == ['FileA']
+    assert provenance.test_dirs_for('ZONE AIR TEMPERATURE', 'LIGHTS') == []
+    assert provenance.test_dirs_for('NOT A VARIABLE', 'ZONE') == []
+
+
+def test_merge_object_renumbers_file_ids():
+    first = Provenance()
+    first.add(first.add_file('FileA'), 'VAR', ['ZONE'])
+    second = Provenance()
+    # FileA has a different file id in the second record
+    second.add(second.add_file('FileC'), 'VAR', ['LIGHTS'])
+    second.add(second.add_file('FileA'), 'VAR', ['LIGHTS'])
+    first.merge_object(second.to_object())
+    assert first.test_dirs == ['FileA', 'FileC']
+    assert first.test_dirs_for('VAR', 'ZONE') == ['FileA']
+    assert first.test_dirs_for('VAR', 'LIGHTS') == ['FileA', 'FileC']
+
+
+def test_dump_and_load(tmp_path: Path):
+    provenance = Provenance()
+    for i in range(20):
+        provenance.add(provenance.add_file('File%02i' % i), 'VAR %i' % (i % 3), ['TYPE %i' % (i % 4)])
+    provenance_path = tmp_path / 'provenance.json'
+    provenance.dump(provenance_path)
+    loaded = Provenance.load(provenance_path)
+    assert loaded.to_object() == provenance.to_object()
+    assert loaded.test_dirs_for('VAR 0', 'TYPE 0') == ['File00', 'File12']
+
+
+def test_load_rejects_other_versions(tmp_path: Path):
+    provenance_path = tmp_path / 'provenance.json'
+    provenance_path.write_text('{"version": %i, "test_dirs": [], "OutputVariables": {}}' % (Provenance.version + 1))
+    with pytest.raises(ValueError):
+        Provenance.load(provenance_path)
+
+
+def test_merged_partials_match_a_single_run(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=12, csv_rows=200).write(build_dir)
+    single = OutputVariableMapper(build_dir, observers=[], track_provenance=True)
+    partial_paths = list()
+    for shard_index in range(2):
+        partial_path = tmp_path / ('partial_%i.json' % shard_index)
+        shard = OutputVariableMapper(build_dir, shard=(shard_index, 2), observers=[], track_provenance=True)
+        shard.dump_partial_results(partial_path)
+        partial_paths.append(partial_path)
+    merged = OutputVariableMapper.from_partial_results(partial_paths, track_provenance=True)
+    assert sorted(merged.provenance.test_dirs) == sorted(single.provenance.test_dirs)
+    pairs = provenance_pairs(single.provenance)
+    assert pairs
+    assert provenance_pairs(merged.provenance) == pairs
+    for var_name, object_type in pairs:
+        test_dirs = single.provenance.test_dirs_for(var_name, object_type)
+        assert test_dirs
+        assert merged.provenance.test_dirs_for(var_name, object_type) == test_dirs
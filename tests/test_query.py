@@ -0,0 +1,84 @@
+from json import loads
+from pathlib import Path
+
+import pytest
+
+from ovmapper.processor import OutputVariableMapper
+from ovmapper.query import MappingIndex, write_index
+from ovmapper.synthetic import SyntheticBuildTree
+
+
+def test_index_matches_the_json_maps(tmp_path: Path):
+    build_dir = tmp_path / 'build'
+    SyntheticBuildTree(num_dirs=10, csv_rows=300).write(build_dir)
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    OutputVariableMapper(build_dir, observers=[]).dump_results(output_dir)
+    var_to_objects = dict()
+    for var_objects in loads((output_dir / 'output_var_to_object_map.json').read_text())['OutputVariables']:
+        var_to_objects.update(var_objects)
+    object_to_vars = loads((output_dir / 'object_to_output_var_map.json').read_text())['OutputVariables']
+    assert var_to_objects and object_to_vars
+    with MappingIndex(output_dir / 'output_var_object_map.idx') as index:
+        assert list(index.output_variables()) == sorted(var_to_objects)
+        assert list(index.object_types()) == sorted(object_to_vars)
+        for var_name, object_types in var_to_objects.items():
+            assert index.object_types_for(var_name) == object_types
+        for object_type, var_names in object_to_vars.items():
+            assert index.output_variables_for(object_type) == sorted(var_names)
+
+
+def test_unknown_names_give_empty_lists(tmp_path: Path):
+    index_path = tmp_path / 'map.idx'
+    write_index(index_path, {'ZONE AIR TEMPERATURE': {'ZONE'}, 'MYSTERY VARIABLE': set()})
+    with MappingIndex(index_path) as index:
+        assert index.object_types_for('NOT A VARIABLE') == []
+        assert index.object_types_for('') == []
+        assert index.object_types_for('ZONE AIR TEMPERATURE') == ['ZONE']
+        assert index.object_types_for('MYSTERY VARIABLE') == []
+        assert index.output_variables_for('NOT A TYPE') == []
+        # names that sort before the first and after the last entry
+        assert index.output_variables_for('A') == []
+        assert index.output_variables_for('ZZZZ') == []
+
+
+def test_empty_mapping(tmp_path: Path):
+    index_path = tmp_path / 'map.idx'
+    write_index(index_path, {})
+    with MappingIndex(index_path) as index:
+        assert index.object_types_for('ZONE AIR TEMPERATURE') == []
+        assert index.output_variables_for('ZONE') == []
+        assert list(index.output_variables()) == []
+        assert list(index.object_types()) == []
+        assert index.num_output_variables == index.num_object_types == 0
+
+
+def test_non_ascii_names(tmp_path: Path):
+    mapping = {
+        'ZONE TEMPÉRATURE': {'ZONE', 'ZÖNE'},
+        'ZONE TEMPERATURE': {'ZONE'},
+        'ZONE TEMPERATURE ÿ': {'ZÖNE'},
+        'ZONE TEMPERATURE Ā': {'ZONE', '\U0001f600 TYPE'},
+        '日本 ZONE': {'Z'},
+    }
+    index_path = tmp_path / 'map.idx'
+    write_index(index_path, mapping)
+    byte_order = sorted(mapping, key=lambda x: x.encode('utf-8'))
+    with MappingIndex(index_path) as index:
+        assert list(index.output_variables()) == byte_order
+        for var_name, object_types in mapping.items():
+            assert index.object_types_for(var_name) == sorted(object_types, key=lambda x: x.encode('utf-8'))
+        assert index.output_variables_for('ZÖNE') == ['ZONE TEMPERATURE ÿ', 'ZONE TEMPÉRATURE']
+        assert index.output_variables_for('\U0001f600 TYPE') == ['ZONE TEMPERATURE Ā']
+
+
+def test_bad_magic_raises(tmp_path: Path):
+    good_path = tmp_path / 'map.idx'
+    write_index(good_path, {'ZONE AIR TEMPERATURE': {'ZONE'}})
+    bad_path = tmp_path / 'bad.idx'
+    bad_path.write_bytes(b'NOTANIDX' + good_path.read_bytes()[8:])
+    index = MappingIndex(bad_path)
+    with pytest.raises(ValueError):
+        index.object_types_for('ZONE AIR TEMPERATURE')
+    # the file is closed again after the failed open
+    assert index._data is None